@@ -0,0 +1,153 @@
+from flask import current_app, request, send_from_directory
+from .compression import brotli, choose_encoding
+import mimetypes
+import hashlib
+import json
+import gzip
+import re
+import os
+
+# Built assets are written to this folder inside of the static folder, along with the manifest
+BUILD_DIRECTORY = "build"
+MANIFEST_NAME = "manifest.json"
+
+# Extensions that are fingerprinted, and those that are also precompressed
+ASSET_EXTENSIONS = [".css", ".js"]
+ENCODING_EXTENSIONS = {"br": ".br", "gzip": ".gz"}
+
+# Hashed filenames never change contents, so they can be cached for a year
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+def minify_css(css):
+    """ Removes comments and whitespace that doesn't change the meaning of the stylesheet """
+
+    css = re.sub(r"/\*.*?\*/", "", css, flags=re.DOTALL)
+    css = re.sub(r"\s+", " ", css)
+
+    # Whitespace before a colon is kept as "a :hover" and "a:hover" are different selectors
+    css = re.sub(r"\s*([{};,>])\s*", r"\1", css)
+    css = re.sub(r":\s+", ":", css)
+    css = css.replace(";}", "}")
+
+    return css.strip()
+
+
+def build_assets(static_folder):
+    """ Fingerprints, minifies and precompresses every asset in the static folder
+    Returns the manifest, which maps the original filenames to the built ones
+    """
+
+    build_folder = os.path.join(static_folder, BUILD_DIRECTORY)
+    manifest = {}
+
+    for root, dirs, files in os.walk(static_folder):
+
+        # Don't build the output of previous builds
+        if os.path.abspath(root) == os.path.abspath(static_folder) and BUILD_DIRECTORY in dirs:
+            dirs.remove(BUILD_DIRECTORY)
+
+        for name in files:
+            base, extension = os.path.splitext(name)
+
+            if extension not in ASSET_EXTENSIONS:
+                continue
+
+            path = os.path.join(root, name)
+            filename = os.path.relpath(path, static_folder).replace(os.sep, "/")
+
+            with open(path, "rb") as f:
+                data = f.read()
+
+            if extension == ".css":
+                data = minify_css(data.decode("utf-8")).encode("utf-8")
+
+            # The hash is of the built file, so a change to minification also changes the url
+            digest = hashlib.md5(data).hexdigest()[:12]
+            built_filename = "/".join([BUILD_DIRECTORY, os.path.dirname(filename), "{}.{}{}".format(base, digest, extension)]).replace("//", "/")
+            built_path = os.path.join(static_folder, *built_filename.split("/"))
+
+            if not os.path.isdir(os.path.dirname(built_path)):
+                os.makedirs(os.path.dirname(built_path))
+
+            with open(built_path, "wb") as f:
+                f.write(data)
+
+            with open(built_path + ENCODING_EXTENSIONS["gzip"], "wb") as f:
+                f.write(gzip.compress(data, compresslevel=9))
+
+            if brotli is not None:
+                with open(built_path + ENCODING_EXTENSIONS["br"], "wb") as f:
+                    f.write(brotli.compress(data, quality=11))
+
+            manifest[filename] = built_filename
+
+    if not os.path.isdir(build_folder):
+        os.makedirs(build_folder)
+
+    with open(os.path.join(build_folder, MANIFEST_NAME), "w") as f:
+        json.dump(manifest, f, indent=4, sort_keys=True)
+
+    return manifest
+
+
+class Assets(object):
+    """ Serves the output of build_assets
+    url_for('static', ...) is rewritten to point at the built file, which is sent precompressed with immutable cache headers
+    If the assets haven't been built, static files are served as normal
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        manifest_path = os.path.join(app.static_folder, BUILD_DIRECTORY, MANIFEST_NAME)
+
+        if not os.path.isfile(manifest_path):
+            return
+
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+
+        app.extensions["assets"] = {
+            "manifest": manifest,
+            "built": set(manifest.values())
+        }
+
+        app.url_defaults(self.url_defaults)
+        app.view_functions["static"] = self.send_static_file
+
+    def url_defaults(self, endpoint, values):
+        """ Swaps static filenames for their fingerprinted versions when building urls """
+
+        if endpoint == "static" and "filename" in values:
+            values["filename"] = current_app.extensions["assets"]["manifest"].get(values["filename"], values["filename"])
+
+    def send_static_file(self, filename):
+        """ Sends built files with the best precompressed variant the client accepts """
+
+        if filename not in current_app.extensions["assets"]["built"]:
+            return current_app.send_static_file(filename)
+
+        supported = []
+
+        for encoding, extension in sorted(ENCODING_EXTENSIONS.items()):
+            if os.path.isfile(os.path.join(current_app.static_folder, filename + extension)):
+                supported.append(encoding)
+
+        encoding = choose_encoding(request.headers.get("Accept-Encoding", ""), supported)
+
+        # The mimetype has to be guessed from the original filename, as the one from the compressed variant would be for .gz or .br
+        mimetype = mimetypes.guess_type(filename)[0]
+
+        if encoding is None:
+            response = send_from_directory(current_app.static_folder, filename, mimetype=mimetype)
+        else:
+            response = send_from_directory(current_app.static_folder, filename + ENCODING_EXTENSIONS[encoding], mimetype=mimetype)
+            response.headers["Content-Encoding"] = encoding
+
+        response.vary.add("Accept-Encoding")
+        response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+
+        return response
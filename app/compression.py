@@ -0,0 +1,94 @@
+from flask import current_app, request
+import gzip
+
+# Brotli is optional. Without it responses are only ever gzipped
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+class Compress(object):
+    """ Compresses text responses with gzip or brotli, depending on what the client accepts
+    Responses smaller than COMPRESS_MIN_SIZE aren't worth the cpu time and are sent as is
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("COMPRESS_ENABLED", True)
+        app.config.setdefault("COMPRESS_MIN_SIZE", 500)
+        app.config.setdefault("COMPRESS_LEVEL", 6)
+        app.config.setdefault("COMPRESS_BROTLI_QUALITY", 4)
+        app.config.setdefault("COMPRESS_MIMETYPES", ["text/html", "text/css", "text/plain", "application/json", "application/javascript"])
+
+        if app.config["COMPRESS_ENABLED"]:
+            app.after_request(self.after_request)
+
+    def after_request(self, response):
+
+        # Files from send_file (like the images from api_return_image) are passed through without being read, and images are already compressed
+        # Responses that are streamed or already have an encoding are left alone too
+        if response.direct_passthrough or response.is_streamed or "Content-Encoding" in response.headers:
+            return response
+
+        if response.mimetype not in current_app.config["COMPRESS_MIMETYPES"] or response.status_code < 200 or response.status_code == 204:
+            return response
+
+        # Whether or not this response gets compressed, the output depends on Accept-Encoding, so caches need to know that
+        response.vary.add("Accept-Encoding")
+
+        encoding = choose_encoding(request.headers.get("Accept-Encoding", ""))
+
+        if encoding is None:
+            return response
+
+        data = response.get_data()
+
+        if len(data) < current_app.config["COMPRESS_MIN_SIZE"]:
+            return response
+
+        if encoding == "br":
+            data = brotli.compress(data, quality=current_app.config["COMPRESS_BROTLI_QUALITY"])
+        else:
+            data = gzip.compress(data, compresslevel=current_app.config["COMPRESS_LEVEL"])
+
+        response.set_data(data)
+        response.headers["Content-Encoding"] = encoding
+
+        return response
+
+
+def choose_encoding(accept_encoding, supported=None):
+    """ Returns the best encoding the client accepts, or None if it doesn't accept any
+    supported is the list of encodings that can be sent, in order of preference
+    Brotli is preferred over gzip as it gives smaller text responses at similar speeds
+    """
+
+    if supported is None:
+        supported = ["br", "gzip"] if brotli is not None else ["gzip"]
+
+    accepted = {}
+
+    for item in accept_encoding.split(","):
+        parts = item.strip().split(";")
+        quality = 1.0
+
+        for param in parts[1:]:
+            param = param.strip()
+
+            if param.startswith("q="):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    quality = 0.0
+
+        accepted[parts[0].strip().lower()] = quality
+
+    for encoding in supported:
+        if accepted.get(encoding, accepted.get("*", 0)) > 0:
+            return encoding
+
+    return None
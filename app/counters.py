@@ -0,0 +1,196 @@
+from flask import current_app, request
+from threading import Lock
+import hashlib
+import math
+import time
+
+from .models import db
+from .ratelimit import get_client_ip
+
+
+class HyperLogLog(object):
+    """ Estimates the number of distinct values added to it, in 2 ** precision bytes
+    The standard error is about 1.04 / sqrt(2 ** precision), so 3% at the default precision of 10
+    Sketches of the same precision can be merged, which gives the estimate for everything added to either
+    """
+
+    def __init__(self, precision, registers=None):
+        self.precision = precision
+        self.registers = bytearray(registers) if registers is not None else bytearray(2 ** precision)
+
+    def add(self, value):
+
+        # The first bits of the hash pick a register, which keeps the longest run of zeros seen in the rest
+        bits = 64 - self.precision
+        value = int.from_bytes(hashlib.sha1(value.encode("utf-8")).digest()[:8], "big")
+
+        index = value >> bits
+        rank = bits - (value & ((1 << bits) - 1)).bit_length() + 1
+
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other):
+        for i, rank in enumerate(other.registers):
+            if rank > self.registers[i]:
+                self.registers[i] = rank
+
+    def count(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+
+        estimate = alpha * m * m / sum(2.0 ** -rank for rank in self.registers)
+
+        # Small counts leave most registers empty, and are estimated more accurately by counting the empty ones
+        zeros = self.registers.count(0)
+
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(float(m) / zeros)
+
+        return int(round(estimate))
+
+    def to_bytes(self):
+        return bytes(self.registers)
+
+
+class ViewCounter(object):
+    """ Counts image views in the memory of each process, and writes them to the database in batches
+    Each flush is two statements no matter how many views there were, rather than a write for every image fetched
+    Views that haven't been flushed yet are lost if the worker is killed, so counts can be off by VIEWS_FLUSH_SECONDS of views
+    """
+
+    def __init__(self, app=None):
+        self.lock = Lock()
+        self.views = {}
+        self.sketches = {}
+        self.pending = 0
+        self.flushed_on = time.monotonic()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("VIEWS_ENABLED", True)
+        app.config.setdefault("VIEWS_FLUSH_SECONDS", 30)
+        app.config.setdefault("VIEWS_FLUSH_COUNT", 1000)
+        app.config.setdefault("VIEWS_SKETCH_PRECISION", 10)
+
+    def record(self, photo_id, viewer):
+        """ Counts a view of a photo by viewer, which is any string identifying them """
+
+        with self.lock:
+            self.views[photo_id] = self.views.get(photo_id, 0) + 1
+
+            if photo_id not in self.sketches:
+                self.sketches[photo_id] = HyperLogLog(current_app.config["VIEWS_SKETCH_PRECISION"])
+
+            self.sketches[photo_id].add(viewer)
+            self.pending += 1
+
+    def count_view(self, photo_id):
+        """ Counts a view of a photo by the client making the current request, and flushes the counts if it's time to
+        A failed flush is logged rather than raised, so it doesn't stop the image from being sent
+        """
+
+        if not current_app.config["VIEWS_ENABLED"]:
+            return
+
+        self.record(photo_id, get_viewer())
+
+        if self.should_flush():
+            try:
+                self.flush()
+            except Exception:
+                current_app.logger.exception("Flushing view counts failed")
+
+    def should_flush(self):
+        return self.pending >= current_app.config["VIEWS_FLUSH_COUNT"] or time.monotonic() - self.flushed_on >= current_app.config["VIEWS_FLUSH_SECONDS"]
+
+    def flush(self):
+        """ Adds the views counted since the last flush to the photo table
+        Returns the number of photos that were updated
+        """
+
+        # The counts are swapped out under the lock, so views recorded during the write go into the next flush
+        with self.lock:
+            views, sketches = self.views, self.sketches
+            self.views, self.sketches = {}, {}
+            self.pending = 0
+            self.flushed_on = time.monotonic()
+
+        if not views:
+            return 0
+
+        try:
+            write_views(views, sketches, current_app.config["VIEWS_SKETCH_PRECISION"])
+        except Exception:
+            db.session.rollback()
+
+            # Put the views back so they're written by the next flush
+            with self.lock:
+                for photo_id, count in views.items():
+                    self.views[photo_id] = self.views.get(photo_id, 0) + count
+
+                    if photo_id in self.sketches:
+                        self.sketches[photo_id].merge(sketches[photo_id])
+                    else:
+                        self.sketches[photo_id] = sketches[photo_id]
+
+                    self.pending += count
+
+            raise
+
+        return len(views)
+
+
+def write_views(views, sketches, precision):
+    """ Adds views to the view counts of photos, and merges sketches into their unique viewer sketches, in one transaction """
+
+    ids = sorted(views.keys())
+
+    # Sketches have to be merged with the stored ones in python, so the rows are locked until the update is committed
+    # Locking them in id order keeps workers flushing at the same time from deadlocking
+    rows = db.session.execute(
+        "SELECT id, viewer_sketch FROM photo WHERE id IN (" + ", ".join(":id" + str(i) for i in range(len(ids))) + ") ORDER BY id FOR UPDATE",
+        dict((("id" + str(i), photo_id) for i, photo_id in enumerate(ids)))
+    ).fetchall()
+
+    values = []
+    params = {}
+
+    for i, row in enumerate(rows):
+        sketch = sketches[row.id]
+
+        # A sketch stored with a different precision can't be merged, so the count starts over from the new views
+        if row.viewer_sketch is not None and len(row.viewer_sketch) == 2 ** precision:
+            sketch.merge(HyperLogLog(precision, row.viewer_sketch))
+
+        values.append("(:id{0}, :views{0}, CAST(:sketch{0} AS BYTEA), :unique_viewers{0})".format(i))
+        params.update({
+            "id" + str(i): row.id,
+            "views" + str(i): views[row.id],
+            "sketch" + str(i): sketch.to_bytes(),
+            "unique_viewers" + str(i): sketch.count()
+        })
+
+    # Photos deleted since they were viewed have no row, and their views are dropped
+    if values:
+        db.session.execute(
+            "UPDATE photo SET views = photo.views + v.views, viewer_sketch = v.sketch, unique_viewers = v.unique_viewers " +
+            "FROM (VALUES " + ", ".join(values) + ") AS v (id, views, sketch, unique_viewers) " +
+            "WHERE photo.id = v.id",
+            params
+        )
+
+    db.session.commit()
+
+
+def get_viewer():
+    """ Returns a string identifying the client making the current request, for counting unique viewers
+    It's hashed before it's counted, so the ip isn't stored anywhere
+    """
+
+    return "{}|{}".format(get_client_ip(), request.headers.get("User-Agent", ""))
+
+
+view_counter = ViewCounter()
@@ -0,0 +1,365 @@
+from collections import namedtuple
+from io import BytesIO
+import time
+
+# EXIF tag holding the orientation the camera was held at
+ORIENTATION_TAG = 274
+
+# The transposes that turn an image with each EXIF orientation the right way up, by their names in Pillow
+ORIENTATION_TRANSPOSES = {
+    2: ["FLIP_LEFT_RIGHT"],
+    3: ["ROTATE_180"],
+    4: ["FLIP_TOP_BOTTOM"],
+    5: ["ROTATE_90", "FLIP_TOP_BOTTOM"],
+    6: ["ROTATE_270"],
+    7: ["ROTATE_90", "FLIP_LEFT_RIGHT"],
+    8: ["ROTATE_90"]
+}
+
+# The luminance quantization table from the JPEG standard, which encoders scale to set the quality
+# Comparing an upload's table to it estimates the quality it was saved at
+STANDARD_LUMINANCE_QUANTIZATION = [
+    16, 11, 10, 16, 24, 40, 51, 61,
+    12, 12, 14, 19, 26, 58, 60, 55,
+    14, 13, 16, 24, 40, 57, 69, 56,
+    14, 17, 22, 29, 51, 87, 80, 62,
+    18, 22, 37, 56, 68, 109, 103, 77,
+    24, 35, 55, 64, 81, 104, 113, 92,
+    49, 64, 78, 87, 103, 121, 120, 101,
+    72, 92, 95, 98, 112, 100, 103, 99
+]
+
+# Images are compared for similarity on a few crops of this size, as comparing full images in python would take longer than encoding them
+# The crops are at full resolution, since downscaling hides the compression artifacts that are being looked for
+SIMILARITY_CROP = 64
+SIMILARITY_BLOCK = 8
+
+# Images with more colours than this are treated as photos, which compress much better as jpegs than pngs
+PHOTO_COLOURS = 4096
+
+FORMATS = {
+    "jpeg": ("jpg", "image/jpeg"),
+    "png": ("png", "image/png")
+}
+
+class InvalidImage(Exception):
+    """ Raised when an upload can't be decoded as an image """
+
+
+EncodedImage = namedtuple("EncodedImage", ["data", "extension", "mimetype", "image", "stats"])
+
+
+def apply_orientation(image):
+    """ Returns the image rotated and flipped the way its EXIF orientation says it should be shown
+    The orientation is lost when the metadata is stripped, so it has to be applied to the pixels
+    """
+
+    from PIL import Image
+
+    try:
+        exif = image._getexif() or {}
+    except (AttributeError, IndexError, KeyError, SyntaxError, ValueError):
+
+        # Only jpegs have _getexif, and broken EXIF data raises all sorts of errors
+        exif = {}
+
+    for transpose in ORIENTATION_TRANSPOSES.get(exif.get(ORIENTATION_TAG), []):
+        image = image.transpose(getattr(Image, transpose))
+
+    return image
+
+
+def estimate_quality(image):
+    """ Returns the quality a jpeg was most likely saved at, from 1 to 100, or None if it can't be told
+    This inverts the way libjpeg scales the standard table, so it's exact for images saved by libjpeg and close for other encoders
+    """
+
+    tables = getattr(image, "quantization", None)
+
+    if not tables or 0 not in tables:
+        return None
+
+    # Sums are used as the tables can be stored in zigzag or natural order
+    scale = sum(tables[0]) * 100.0 / sum(STANDARD_LUMINANCE_QUANTIZATION)
+
+    if scale <= 100:
+        quality = (200 - scale) / 2
+    else:
+        quality = 5000 / scale
+
+    return max(1, min(100, int(round(quality))))
+
+
+def has_metadata(image):
+    """ Returns whether a jpeg has anything besides its JFIF and Adobe headers
+    That's EXIF and XMP (APP1), ICC profiles (APP2), IPTC (APP13) and comments, which can hold things like who took a photo and where
+    Images with them always have to be re-encoded, even when that doesn't make them smaller
+    """
+
+    return any(marker not in ["APP0", "APP14"] for marker, data in getattr(image, "applist", []))
+
+
+def convert_to_srgb(image, icc_profile):
+    """ Returns the image converted from its ICC profile to sRGB, which is what browsers assume images without a profile are in
+    Without this, stripping the profile from a wide gamut photo (like Display P3 from a phone) would make its colours dull
+    The image is returned as it is if the profile can't be used, or Pillow was built without littlecms
+    """
+
+    try:
+        from PIL import ImageCms
+    except ImportError:
+        return image
+
+    if image.mode not in ["RGB", "RGBA", "CMYK"]:
+        return image
+
+    try:
+        profile = ImageCms.ImageCmsProfile(BytesIO(icc_profile))
+
+        # Most uploads are already sRGB, and converting them would only cost time
+        if "sRGB" in ImageCms.getProfileDescription(profile):
+            return image
+
+        return ImageCms.profileToProfile(image, profile, ImageCms.createProfile("sRGB"), outputMode="RGBA" if image.mode == "RGBA" else "RGB")
+    except (ImageCms.PyCMSError, IOError, ValueError):
+        return image
+
+
+def has_transparency(image):
+    """ Returns whether any pixel of the image is see through, in which case it can't be saved as a jpeg """
+
+    if image.mode in ["RGBA", "LA"]:
+        return image.split()[-1].getextrema()[0] < 255
+
+    # Palette images have a transparent index, and RGB and greyscale pngs can have a transparent colour
+    return "transparency" in image.info
+
+
+def is_photo(image):
+    """ Returns whether the image looks like a photo rather than a drawing or a screenshot
+    getcolors returns None once there are more than PHOTO_COLOURS colours, so it stops early on photos
+    """
+
+    return image.getcolors(PHOTO_COLOURS) is None
+
+
+def similarity(reference, candidate):
+    """ Returns the mean structural similarity (SSIM) of two images of the same size, from 0 to 1
+    1 means the images are identical. It's calculated over blocks of the luma channel, which is what the eye is most sensitive to
+    """
+
+    width, height = reference.size
+    reference = list(reference.getdata())
+    candidate = list(candidate.getdata())
+
+    # Constants from the SSIM paper, for 8 bit pixels
+    c1 = (0.01 * 255) ** 2
+    c2 = (0.03 * 255) ** 2
+
+    total = 0.0
+    blocks = 0
+
+    for top in range(0, height - SIMILARITY_BLOCK + 1, SIMILARITY_BLOCK):
+        for left in range(0, width - SIMILARITY_BLOCK + 1, SIMILARITY_BLOCK):
+            a = []
+            b = []
+
+            for row in range(top, top + SIMILARITY_BLOCK):
+                a.extend(reference[row * width + left:row * width + left + SIMILARITY_BLOCK])
+                b.extend(candidate[row * width + left:row * width + left + SIMILARITY_BLOCK])
+
+            n = float(len(a))
+            mean_a = sum(a) / n
+            mean_b = sum(b) / n
+            var_a = sum((x - mean_a) ** 2 for x in a) / n
+            var_b = sum((y - mean_b) ** 2 for y in b) / n
+            covariance = sum((x - mean_a) * (y - mean_b) for x, y in zip(a, b)) / n
+
+            total += ((2 * mean_a * mean_b + c1) * (2 * covariance + c2)) / ((mean_a ** 2 + mean_b ** 2 + c1) * (var_a + var_b + c2))
+            blocks += 1
+
+    # Images smaller than a block are compared as a whole
+    if blocks == 0:
+        return 1.0 if reference == candidate else 0.0
+
+    return total / blocks
+
+
+def similarity_crops(image):
+    """ Returns greyscale crops from the centre and the middle of each quarter of the image, which are compared to measure similarity """
+
+    luma = image.convert("L")
+    width, height = luma.size
+
+    half = SIMILARITY_CROP // 2
+    crops = []
+
+    for x, y in [(2, 2), (1, 1), (3, 1), (1, 3), (3, 3)]:
+
+        # Crop centres are kept far enough from the edges for the crop to fit, for images smaller than a crop this is the whole image
+        left = max(0, min(width * x // 4 - half, width - SIMILARITY_CROP))
+        top = max(0, min(height * y // 4 - half, height - SIMILARITY_CROP))
+
+        crops.append(luma.crop((left, top, min(width, left + SIMILARITY_CROP), min(height, top + SIMILARITY_CROP))))
+
+    return crops
+
+
+def encode_jpeg(image, quality):
+    data = BytesIO()
+    image.save(data, format="jpeg", quality=quality, optimize=True)
+
+    return data.getvalue()
+
+
+def search_quality(image, config, start, floor=None):
+    """ Returns the smallest jpeg encoding of the image that's similar enough to the original, and its quality
+    Quality is binary searched until ENCODER_SIMILARITY_TARGET is met, or ENCODER_TIME_BUDGET seconds have passed since start
+    The search doesn't go below floor, which is the quality of the upload for jpegs
+    """
+
+    from PIL import Image
+
+    reference = similarity_crops(image)
+
+    high = config["ENCODER_QUALITY_MAX"]
+    low = max(config["ENCODER_QUALITY_MIN"], min(floor or 0, high))
+
+    # If the search runs out of time before anything is similar enough, the highest quality is used
+    best_quality = high
+    best = None
+
+    while low <= high:
+        quality = (low + high) // 2
+        data = encode_jpeg(image, quality)
+
+        candidate = similarity_crops(Image.open(BytesIO(data)))
+        score = sum(similarity(a, b) for a, b in zip(reference, candidate)) / len(reference)
+
+        if score >= config["ENCODER_SIMILARITY_TARGET"]:
+            best_quality, best = quality, data
+            high = quality - 1
+        else:
+            low = quality + 1
+
+        if time.perf_counter() - start > config["ENCODER_TIME_BUDGET"]:
+            break
+
+    if best is None:
+        best = encode_jpeg(image, best_quality)
+
+    return best, best_quality
+
+
+def identify_image(header):
+    """ Returns the mimetype of an image from the first bytes of its file, which is enough for Pillow to read the format and size
+    Raises InvalidImage if they aren't the start of an image
+    """
+
+    from PIL import Image
+
+    try:
+        image = Image.open(BytesIO(header))
+    except (IOError, SyntaxError, ValueError) as e:
+        raise InvalidImage(str(e))
+
+    return Image.MIME.get(image.format)
+
+
+def encode_image(image_file, config):
+    """ Re-encodes an uploaded image to be as small as possible while still looking the same
+    Metadata is stripped, the EXIF orientation is applied, and photos uploaded as pngs or bmps are converted to jpegs when it makes them smaller
+    Returns an EncodedImage. The image it holds is the re-oriented one, and should be closed by the caller
+    Raises InvalidImage if the file can't be decoded
+    """
+
+    from PIL import Image
+
+    start = time.perf_counter()
+
+    # The original size is needed to report the bytes saved
+    image_file.seek(0, 2)
+    original_bytes = image_file.tell()
+    image_file.seek(0)
+
+    # Pillow raises all sorts of errors for files that aren't images, or are cut off
+    try:
+        image = Image.open(image_file)
+        image.load()
+    except (IOError, SyntaxError, ValueError) as e:
+        raise InvalidImage(str(e))
+
+    original_format = image.format
+
+    # These have to be read before the image is re-oriented, as only the jpeg image the file was opened as has them
+    source_quality = estimate_quality(image) if original_format == "JPEG" else None
+    metadata = has_metadata(image)
+
+    oriented = apply_orientation(image)
+
+    # A jpeg with no metadata to strip and no rotation to apply can be stored as it was uploaded, if re-encoding doesn't make it smaller
+    keep_original = original_format == "JPEG" and not metadata and oriented is image
+
+    image = oriented
+
+    # Transparency is kept in info for palette images and colour keyed pngs, so it's read before the metadata is removed
+    transparent = has_transparency(image)
+    transparency = image.info.get("transparency")
+
+    # The ICC profile is removed with the rest of the metadata, so the pixels are converted to the colours they'd be shown as first
+    if image.info.get("icc_profile"):
+        image = convert_to_srgb(image, image.info["icc_profile"])
+
+    # Removes EXIF, ICC profiles and any other metadata that would otherwise be copied to the new file
+    image.info = {}
+
+    quality = None
+
+    if original_format == "JPEG":
+        output_format = "jpeg"
+
+        # The upload's pixels are already lossy, so they're only compared against at its own quality or higher
+        # Lower qualities would look similar to the artifacts rather than to what was photographed
+        data, quality = search_quality(image.convert("RGB") if image.mode not in ["RGB", "L"] else image, config, start, source_quality)
+
+        if len(data) >= original_bytes and keep_original:
+            image_file.seek(0)
+            data, quality = image_file.read(), source_quality
+
+    elif transparent or not is_photo(image):
+
+        # Drawings, screenshots and see through images are kept lossless
+        # The transparent index or colour has to be passed back in, as it isn't part of the pixels
+        output_format = "png"
+        data = BytesIO()
+
+        if transparency is not None:
+            image.save(data, format="png", optimize=True, transparency=transparency)
+        else:
+            image.save(data, format="png", optimize=True)
+
+        data = data.getvalue()
+
+    else:
+        rgb = image.convert("RGB") if image.mode not in ["RGB", "L"] else image
+        data, quality = search_quality(rgb, config, start)
+        output_format = "jpeg"
+
+        # Lossless pngs of photos are rarely smaller, but if the upload already was, it's re-encoded as a png instead
+        if len(data) >= original_bytes:
+            png = BytesIO()
+            image.save(png, format="png", optimize=True)
+            data, output_format, quality = png.getvalue(), "png", None
+
+    extension, mimetype = FORMATS[output_format]
+
+    stats = {
+        "format": output_format,
+        "quality": quality,
+        "original_bytes": original_bytes,
+        "encoded_bytes": len(data),
+        "bytes_saved": original_bytes - len(data),
+        "encode_ms": int((time.perf_counter() - start) * 1000)
+    }
+
+    return EncodedImage(data, extension, mimetype, image, stats)
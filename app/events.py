@@ -0,0 +1,180 @@
+from queue import Queue, Empty, Full
+from threading import Lock, Thread
+import logging
+import select
+import sys
+import json
+import time
+import os
+
+from .models import db
+
+# Postgres channel photo events are sent on. Every worker listens on it, so an event published by one reaches the subscribers of all of them
+CHANNEL = "photo_events"
+
+# The listener runs outside of any app context, so it logs through the standard logging module
+logger = logging.getLogger(__name__)
+
+
+def is_async_worker():
+    """ Returns whether this process has been monkey patched by gevent, so blocking calls only block the current greenlet
+    gevent is only checked if it's already been imported, as importing it here would be slow and pointless
+    """
+
+    if "gevent" not in sys.modules:
+        return False
+
+    from gevent import monkey
+
+    return monkey.is_module_patched("socket")
+
+
+def publish(event, data):
+    """ Queues an event to be sent to every stream subscriber
+    NOTIFY is transactional, so the event is only sent once the current session is committed, and never if it's rolled back
+    """
+
+    db.session.execute("SELECT pg_notify(:channel, :payload)", {
+        "channel": CHANNEL,
+        "payload": json.dumps({"event": event, "data": data})
+    })
+
+
+def format_event(payload):
+    """ Turns a notification payload into the text of a server sent event
+    This is done once per event, rather than once per subscriber
+    """
+
+    message = json.loads(payload)
+
+    return "event: {}\ndata: {}\n\n".format(message["event"], json.dumps(message["data"]))
+
+
+class Subscription(object):
+    """ The events waiting to be sent to one stream client """
+
+    def __init__(self, max_queued):
+        self.queue = Queue(max_queued)
+        self.closed = False
+
+    def get(self, timeout):
+        """ Returns the next event, or None if there wasn't one within timeout seconds """
+
+        try:
+            return self.queue.get(timeout=timeout)
+        except Empty:
+            return None
+
+
+class Broker(object):
+    """ Fans events out to the stream subscribers of this process
+    There's a single LISTEN connection per process, no matter how many clients are subscribed
+    """
+
+    def __init__(self):
+        self.subscriptions = set()
+        self.lock = Lock()
+        self.listener_pid = None
+
+    def subscribe(self, database_uri, max_queued):
+        subscription = Subscription(max_queued)
+
+        start_listener = False
+
+        with self.lock:
+            self.subscriptions.add(subscription)
+
+            # The listener is started on the first subscription instead of at import, so it's started in the worker rather than the preloading master
+            if self.listener_pid != os.getpid():
+                self.listener_pid = os.getpid()
+                start_listener = True
+
+        # Starting a thread can switch to other greenlets under gevent, so it's done after the lock is released
+        # Otherwise another subscriber could block waiting for the lock while the greenlet holding it never gets to run again
+        if start_listener:
+            listener = Thread(target=self.listen, args=(database_uri,))
+            listener.daemon = True
+            listener.start()
+
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            self.subscriptions.discard(subscription)
+
+    def count(self):
+        return len(self.subscriptions)
+
+    def deliver(self, message):
+        """ Sends an event to every subscriber
+        Subscribers that have fallen too far behind are dropped, so a stalled client can't make the worker buffer events forever
+        """
+
+        with self.lock:
+            subscriptions = list(self.subscriptions)
+
+        for subscription in subscriptions:
+            try:
+                subscription.queue.put_nowait(message)
+            except Full:
+                subscription.closed = True
+                self.unsubscribe(subscription)
+
+    def notify(self, payload):
+        """ Delivers a notification payload to every subscriber
+        Anything can NOTIFY on the channel, so a payload that isn't an event is logged and skipped rather than stopping the listener
+        """
+
+        try:
+            self.deliver(format_event(payload))
+        except Exception:
+            logger.exception("Couldn't deliver event {!r}".format(payload[:200]))
+
+    def listen(self, database_uri):
+        """ Delivers the notifications from the photo_events channel for as long as the process runs
+        The connection is made again if it drops
+        """
+
+        import psycopg2
+        import psycopg2.extensions
+
+        try:
+            while True:
+                conn = None
+
+                try:
+                    conn = psycopg2.connect(database_uri)
+                    conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                    conn.cursor().execute("LISTEN " + CHANNEL)
+
+                    while True:
+
+                        # Wait for the connection to have something to read, waking up now and then in case it silently died
+                        if select.select([conn], [], [], 60) == ([], [], []):
+                            conn.cursor().execute("SELECT 1")
+                            continue
+
+                        conn.poll()
+
+                        while conn.notifies:
+                            self.notify(conn.notifies.pop(0).payload)
+
+                # select raises OSError or ValueError if the connection's socket is closed under it
+                except (psycopg2.Error, OSError, ValueError):
+                    logger.exception("Event listener lost its connection")
+
+                    if conn is not None:
+                        conn.close()
+
+                    # Wait before reconnecting so a database outage doesn't turn into a busy loop
+                    time.sleep(5)
+
+        except Exception:
+            logger.exception("Event listener stopped")
+
+            # The next subscription starts a new listener, instead of every subscriber in this process only getting heartbeats
+            with self.lock:
+                self.listener_pid = None
+
+
+broker = Broker()
@@ -1,5 +1,21 @@
+from flask import current_app
+from werkzeug.utils import secure_filename
+
 from .models import db, Photo
+from .encoder import encode_image, InvalidImage
+from .storage import save_image, sharded_path, image_path, image_fallback, open_image, delete_image
+from .events import publish
+from .tasks import run_blocking
 from random import randint
+import re
+from io import BytesIO
+import tempfile
+import shutil
+import base64
+import time
+
+# The longest side of placeholder images, in pixels
+PLACEHOLDER_SIZE = 20
 
 
 def generate_filename(length):
@@ -13,19 +29,155 @@ def generate_filename(length):
     return filename
 
 
+def parse_content_range(header):
+    """ Returns the first byte, last byte and total length from a Content-Range header like "bytes 0-1023/4096"
+    Returns None if the header is missing or invalid
+    """
+
+    match = re.match(r"^bytes (\d+)-(\d+)/(\d+)$", (header or "").strip())
+
+    if not match:
+        return None
+
+    start, end, total = [int(group) for group in match.groups()]
+
+    if end < start or end >= total:
+        return None
+
+    return start, end, total
+
+
+def generate_placeholder(image):
+    """ Returns a tiny, blurry version of the image as a data uri
+    It's small enough to be sent inline with the image list and shown while the full image downloads
+    """
+
+    from PIL import Image
+
+    placeholder = image.convert("RGB")
+    placeholder.thumbnail((PLACEHOLDER_SIZE, PLACEHOLDER_SIZE), Image.BILINEAR)
+
+    data = BytesIO()
+    placeholder.save(data, format="jpeg", quality=50)
+
+    return "data:image/jpeg;base64," + base64.b64encode(data.getvalue()).decode("ascii")
+
+
+def create_photo(image_file, title, config):
+    """ Re-encodes an uploaded image, stores it, and creates its database entry
+    Returns the photo, and the stats of the encoding
+    """
+
+    encoded = run_blocking(encode_image, image_file, config)
+
+    # File to save the image to. The filename is randomly generated from the generate_filname function
+    # The extension comes from the encoding, as pngs and bmps can be converted to jpegs
+    # TODO: Check for a collision with an already existing filename. This is really not that urgent as the chances of it happening are astronomical
+    filename = secure_filename(generate_filename(config["IMAGE_NAME_LENGTH"]) + "." + encoded.extension)
+
+    storage_path = sharded_path(filename, config["STORAGE_FANOUT"])
+    save_image(config, encoded.data, storage_path, encoded.mimetype)
+
+    # The size and a tiny preview are stored so clients can lay out the image before it's downloaded
+    width, height = encoded.image.size
+    placeholder = run_blocking(generate_placeholder, encoded.image)
+
+    encoded.image.close()
+
+    # Create a database entry for the new image
+    photo = Photo(title=title, filename=filename, mimetype=encoded.mimetype, width=width, height=height, placeholder=placeholder, storage_path=storage_path)
+    db.session.add(photo)
+
+    # Flush to get the id of the photo for the event, which is sent when the photo is committed
+    db.session.flush()
+    publish("photo", {"id": photo.id, "title": photo.title, "votes": photo.votes, "width": photo.width, "height": photo.height})
+
+    db.session.commit()
+
+    return photo, encoded.stats
+
+
+def process_photo(photo_id, config):
+    """ Re-encodes a photo that was uploaded straight to S3, and stores its size and placeholder
+    This runs in the background after the upload is finalized, so until it's done the photo is served as it was uploaded
+    Raises InvalidImage if the upload can't be decoded, after deleting the photo and the upload
+    """
+
+    photo = Photo.query.filter_by(id=photo_id).first()
+
+    if photo is None or photo.processed:
+        return
+
+    original_path = image_path(photo)
+
+    # S3 keys can't seek, which the encoder needs, so the upload is copied to a temporary file first
+    with tempfile.TemporaryFile() as image_file:
+        original = open_image(config, original_path, fallback=image_fallback(config, photo))
+        shutil.copyfileobj(original, image_file)
+        original.close()
+
+        try:
+            encoded = run_blocking(encode_image, image_file, config)
+        except InvalidImage:
+
+            # Only the start of the upload was checked when it was finalized, so the rest of it can still be broken
+            # The photo can never be shown, so it's removed along with the upload
+            db.session.delete(photo)
+            db.session.commit()
+
+            delete_image(config, original_path)
+
+            raise
+
+    # The extension can change, as pngs and bmps can be converted to jpegs
+    filename = secure_filename(photo.filename.rsplit(".", 1)[0] + "." + encoded.extension)
+    storage_path = sharded_path(filename, config["STORAGE_FANOUT"])
+
+    save_image(config, encoded.data, storage_path, encoded.mimetype)
+
+    photo.filename = filename
+    photo.storage_path = storage_path
+    photo.mimetype = encoded.mimetype
+    photo.width, photo.height = encoded.image.size
+    photo.placeholder = run_blocking(generate_placeholder, encoded.image)
+    photo.processed = True
+
+    encoded.image.close()
+
+    db.session.commit()
+
+    # The original is only deleted once the photo points at the new image
+    if storage_path != original_path:
+        delete_image(config, original_path)
+
+    current_app.logger.info("Encoded photo {} as {} in {} ms, saving {} bytes".format(photo.id, encoded.stats["format"], encoded.stats["encode_ms"], encoded.stats["bytes_saved"]))
+
+    return encoded.stats
+
+
+# The sort functions fetch one more image than fits on a page
+# If it's returned there's another page after this one, which is cheaper to find out than counting the whole table
+def paginate(images, images_per_page):
+    """ Splits the result of a sort function into the images for the page, and whether there's a next page """
+
+    images = list(images)
+
+    return images[:images_per_page], len(images) > images_per_page
+
+
 def get_images_sort_old(page, images_per_page):
 
     # Sort by ascending creation date
-    return Photo.query.order_by(Photo.created_on).offset(images_per_page * page).limit(images_per_page)
+    return Photo.query.order_by(Photo.created_on).offset(images_per_page * page).limit(images_per_page + 1)
 
 
 def get_images_sort_new(page, images_per_page):
 
     # Sort by descending creation date
-    return Photo.query.order_by(Photo.created_on.desc()).offset(images_per_page * page).limit(images_per_page)
+    return Photo.query.order_by(Photo.created_on.desc()).offset(images_per_page * page).limit(images_per_page + 1)
 
 
-def get_images_sort_hot(page, images_per_page):
+def get_images_sort_hot(page, images_per_page, views_weight=0.0):
     # Implementation of reddit's hot sorting algorithm in SQL
     # This is implemented in SQL because it's sorting in the database and limiting to the number of images per page is more efficient than getting the whole table
     # The number of images per page is set in the config
@@ -35,8 +187,42 @@ def get_images_sort_hot(page, images_per_page):
     # While this could be moved to a constant, it is simpler to have it in the query as it's only used once,
     # and using string concating is a bit of a hack when creating queries
 
+    # Unique viewers are added to the votes as views_weight points each, which is HOT_VIEWS_WEIGHT in the config
+    points = "(photo.votes + :views_weight * photo.unique_viewers)"
+
     return db.session.execute(
-        "SELECT photo.id, photo.title, photo.filename, photo.mimetype, photo.votes, photo.created_on FROM photo " +
-        "ORDER BY ROUND(CAST(LOG(GREATEST(ABS(photo.votes), 1)) * SIGN(photo.votes) + DATE_PART('epoch', photo.created_on) / 45000.0 as NUMERIC), 7) DESC " +
-        "OFFSET " + str(images_per_page * page) + " LIMIT " + str(images_per_page)
+        "SELECT photo.id, photo.title, photo.filename, photo.mimetype, photo.votes, photo.views, photo.unique_viewers, photo.width, photo.height, photo.placeholder, photo.created_on FROM photo " +
+        "ORDER BY ROUND(CAST(LOG(GREATEST(ABS(" + points + "), 1)) * SIGN(" + points + ") + DATE_PART('epoch', photo.created_on) / 45000.0 as NUMERIC), 7) DESC " +
+        "OFFSET " + str(images_per_page * page) + " LIMIT " + str(images_per_page + 1),
+        {"views_weight": views_weight}
     )
+
+
+# Per process cache of the image count, as (count, approximate, time it was counted)
+_count_cache = None
+
+
+def count_images(cache_seconds, exact_threshold):
+    """ Returns the number of images, and whether that number is approximate
+    COUNT(*) has to scan the whole photo table, so large tables use the row estimate postgres keeps for the query planner instead
+    The result is cached for cache_seconds
+    """
+
+    global _count_cache
+
+    if _count_cache is not None and time.monotonic() - _count_cache[2] < cache_seconds:
+        return _count_cache[0], _count_cache[1]
+
+    # reltuples is updated by VACUUM and ANALYZE, and is -1 or 0 for tables that have never been analyzed
+    estimate = db.session.execute("SELECT reltuples FROM pg_class WHERE relname = 'photo'").scalar()
+
+    if estimate is not None and estimate >= exact_threshold:
+        count, approximate = int(estimate), True
+    else:
+
+        # Small tables are cheap to count, and their estimate is the most likely to be off
+        count, approximate = Photo.query.count(), False
+
+    _count_cache = (count, approximate, time.monotonic())
+
+    return count, approximate
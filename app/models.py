@@ -10,11 +10,78 @@ class Photo(db.Model):
     votes = db.Column(db.Integer, nullable=False, default=0)
     created_on = db.Column(db.DateTime, server_default=db.func.now())
 
-    def __init__(self, title, filename, mimetype, votes=0):
+    # Dimensions of the stored image, and a tiny preview of it as a data uri
+    width = db.Column(db.Integer)
+    height = db.Column(db.Integer)
+    placeholder = db.Column(db.Text)
+
+    # Where the image is stored, relative to the image folder or bucket directory
+    # Photos stored before sharding have no storage path, and are stored flat at their filename
+    storage_path = db.Column(db.String(256))
+
+    # Photos uploaded straight to S3 are stored as they were sent until they've been re-encoded in the background
+    processed = db.Column(db.Boolean, nullable=False, default=True, server_default=db.true())
+
+    # The filename a direct upload was signed for. Processing can change the filename, so this is what finalizing twice is checked against
+    upload_filename = db.Column(db.String(128), unique=True)
+
+    # View counts are written in batches, so they lag behind by up to VIEWS_FLUSH_SECONDS
+    # Unique viewers are estimated from a HyperLogLog sketch of the viewers, which is stored so that later views can be merged into it
+    views = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    unique_viewers = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    # It's only read when views are flushed, so it's deferred to keep it out of every other photo query
+    viewer_sketch = db.deferred(db.Column(db.LargeBinary))
+
+    def __init__(self, title, filename, mimetype, votes=0, width=None, height=None, placeholder=None, storage_path=None, processed=True, upload_filename=None):
         self.title = title
         self.filename = filename
         self.mimetype = mimetype
         self.votes = votes
+        self.width = width
+        self.height = height
+        self.placeholder = placeholder
+        self.storage_path = storage_path
+        self.processed = processed
+        self.upload_filename = upload_filename
+        self.views = 0
+        self.unique_viewers = 0
 
     def __repr__(self):
         return "<Photo ID: {}, Title: {}, Votes: {}, Creation_Date: {}>".format(self.id, self.title, self.votes, self.created_on)
+
+
+class Upload(db.Model):
+    """ A resumable upload that hasn't been finalized yet """
+
+    id = db.Column(db.String(32), primary_key=True)
+    title = db.Column(db.String(128))
+    length = db.Column(db.BigInteger, nullable=False)
+    offset = db.Column(db.BigInteger, nullable=False, default=0)
+
+    # The S3 multipart upload the chunks are sent to in prod, and how many parts it has
+    multipart_id = db.Column(db.String(256))
+    parts = db.Column(db.Integer, nullable=False, default=0)
+
+    created_on = db.Column(db.DateTime, server_default=db.func.now())
+
+    def __init__(self, id, title, length, multipart_id=None):
+        self.id = id
+        self.title = title
+        self.length = length
+        self.offset = 0
+        self.multipart_id = multipart_id
+        self.parts = 0
+
+    def __repr__(self):
+        return "<Upload ID: {}, Title: {}, Offset: {}, Length: {}>".format(self.id, self.title, self.offset, self.length)
+
+
+class RateLimitBucket(db.Model):
+    __tablename__ = "rate_limit_bucket"
+
+    key = db.Column(db.String(128), primary_key=True)
+    tokens = db.Column(db.Float, nullable=False)
+    updated_on = db.Column(db.DateTime(timezone=True), nullable=False, server_default=db.func.now())
+
+    def __repr__(self):
+        return "<RateLimitBucket Key: {}, Tokens: {}>".format(self.key, self.tokens)
@@ -0,0 +1,191 @@
+from flask import current_app, request, g
+from itsdangerous import TimestampSigner, BadSignature
+from threading import Thread, Event, get_ident
+from collections import Counter
+import random
+import signal
+import time
+import sys
+import os
+
+from .events import is_async_worker
+# Salt for the profile header signature, so a signature made for something else with ADMIN_PASSWORD can't be reused
+SIGNATURE_SALT = "profile"
+
+
+class StackCounter(object):
+    """ Counts sampled stacks in the "folded" format, which flamegraph.pl and speedscope read """
+
+    def __init__(self):
+        self.stacks = Counter()
+
+    def record(self, frame):
+        stack = []
+
+        while frame is not None:
+            stack.append("{}:{}".format(frame.f_globals.get("__name__", "?"), frame.f_code.co_name))
+            frame = frame.f_back
+
+        # Frames are collected from the innermost out, but folded stacks go from the outermost in
+        if stack:
+            self.stacks[";".join(reversed(stack))] += 1
+
+    def write(self, path):
+        with open(path, "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write("{} {}\n".format(stack, count))
+
+
+class Sampler(StackCounter):
+    """ Samples the stack of a thread at a fixed interval until stopped """
+
+    def __init__(self, thread_id, interval):
+        super(Sampler, self).__init__()
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stopped = Event()
+        self.thread = Thread(target=self.run)
+        self.thread.daemon = True
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.record(sys._current_frames().get(self.thread_id))
+
+
+class GreenletSampler(StackCounter):
+    """ Samples the stack of a greenlet at a fixed interval until stopped, for gevent workers
+    A sampling thread or greenlet can't run while a request is using the CPU, so samples are taken by a SIGPROF handler instead
+    SIGPROF is sent every interval of CPU time used by the process, and its handler runs in the main thread, where the greenlets are
+    Every greenlet being profiled shares the one timer, so the interval of the first one started is used until all of them stop
+    """
+
+    # Greenlets being profiled, and their samplers
+    active = {}
+    previous_handler = None
+
+    def __init__(self, greenlet, interval):
+        super(GreenletSampler, self).__init__()
+        self.greenlet = greenlet
+        self.interval = interval
+
+    def start(self):
+        if not GreenletSampler.active:
+            GreenletSampler.previous_handler = signal.signal(signal.SIGPROF, GreenletSampler.handle)
+            signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+        GreenletSampler.active[self.greenlet] = self
+
+    def stop(self):
+        GreenletSampler.active.pop(self.greenlet, None)
+
+        if not GreenletSampler.active:
+            signal.setitimer(signal.ITIMER_PROF, 0)
+            signal.signal(signal.SIGPROF, GreenletSampler.previous_handler or signal.SIG_DFL)
+
+    @staticmethod
+    def handle(signum, frame):
+        from gevent import getcurrent
+
+        current = getcurrent()
+
+        for greenlet, sampler in list(GreenletSampler.active.items()):
+            # The handler was passed the frame of the greenlet that was running, and the others are waiting where they last switched out
+            sampler.record(frame if greenlet is current else greenlet.gr_frame)
+
+
+class Profiler(object):
+    """ Profiles a sample of requests, and requests with a profile header signed with ADMIN_PASSWORD
+    Nothing is registered on the app unless PROFILER_ENABLED is set, so it costs nothing when it's off
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("PROFILER_ENABLED", False)
+        app.config.setdefault("PROFILER_SAMPLE_RATE", 0)
+        app.config.setdefault("PROFILER_INTERVAL", 0.005)
+        app.config.setdefault("PROFILER_OUTPUT_DIR", "profiles")
+        app.config.setdefault("PROFILER_HEADER", "X-Profile")
+        app.config.setdefault("PROFILER_SIGNATURE_MAX_AGE", 3600)
+
+        if not app.config["PROFILER_ENABLED"]:
+            return
+
+        app.before_request(self.before_request)
+        app.teardown_request(self.teardown_request)
+
+    def should_profile(self):
+        """ Returns whether the current request should be profiled
+        1 in PROFILER_SAMPLE_RATE requests are picked at random, or none if it's 0
+        """
+
+        rate = current_app.config["PROFILER_SAMPLE_RATE"]
+
+        if rate and random.randrange(rate) == 0:
+            return True
+
+        signature = request.headers.get(current_app.config["PROFILER_HEADER"])
+
+        if signature is None or not current_app.config["ADMIN_PASSWORD"]:
+            return False
+
+        try:
+            signer(current_app.config["ADMIN_PASSWORD"]).unsign(signature, max_age=current_app.config["PROFILER_SIGNATURE_MAX_AGE"])
+        except BadSignature:
+            return False
+
+        return True
+
+    def before_request(self):
+        if not self.should_profile():
+            return
+
+        interval = current_app.config["PROFILER_INTERVAL"]
+
+        # Under gevent, get_ident returns the id of the greenlet rather than the thread, so the thread sampler would never find its frames
+        if is_async_worker():
+            from gevent import getcurrent
+            g.profiler_sampler = GreenletSampler(getcurrent(), interval)
+        else:
+            g.profiler_sampler = Sampler(get_ident(), interval)
+
+        g.profiler_start = time.time()
+        g.profiler_sampler.start()
+
+    def teardown_request(self, exception):
+        sampler = g.pop("profiler_sampler", None)
+
+        if sampler is None:
+            return
+
+        sampler.stop()
+
+        output_dir = current_app.config["PROFILER_OUTPUT_DIR"]
+
+        if not os.path.isdir(output_dir):
+            os.makedirs(output_dir)
+
+        # The name sorts by time, and says which route was profiled
+        filename = "{}-{}-{}.folded".format(int(g.pop("profiler_start") * 1000), os.getpid(), request.endpoint or "unknown")
+        sampler.write(os.path.join(output_dir, filename))
+
+        current_app.logger.info("Profiled {} {} to {}".format(request.method, request.path, filename))
+
+
+def signer(admin_password):
+    return TimestampSigner(admin_password, salt=SIGNATURE_SALT)
+
+
+def generate_profile_token(admin_password):
+    """ Returns a value for the profile header, which is valid for PROFILER_SIGNATURE_MAX_AGE seconds """
+
+    return signer(admin_password).sign("profile").decode("ascii")
@@ -0,0 +1,197 @@
+from flask import current_app, request, jsonify, make_response
+from functools import wraps
+from threading import Lock
+import time
+
+from .models import db
+
+
+class MemoryBackend(object):
+    """ Token buckets kept in the memory of the current process
+    Fast, but every gunicorn worker keeps its own buckets, so the effective limit is multiplied by the number of workers
+    Buckets that have refilled are dropped every prune_seconds, as a missing bucket is the same as a full one
+    """
+
+    def __init__(self, prune_seconds=60):
+        self.buckets = {}
+        self.lock = Lock()
+        self.prune_seconds = prune_seconds
+        self.pruned_on = time.monotonic()
+
+    def hit(self, key, capacity, rate):
+        """ Takes a token from the bucket for key
+        Returns 0 if the request is allowed, otherwise the number of seconds until a token is available
+        """
+
+        now = time.monotonic()
+
+        with self.lock:
+            if now - self.pruned_on >= self.prune_seconds:
+                self.prune(now)
+
+            tokens, updated_on, full_on = self.buckets.get(key, (capacity, now, now))
+
+            # Refill the bucket for the time that passed since it was last touched, without going over the capacity
+            tokens = min(capacity, tokens + (now - updated_on) * rate)
+
+            if tokens >= 1:
+                tokens -= 1
+                retry_after = 0
+            else:
+                retry_after = (1 - tokens) / rate
+
+            # The time the bucket will be full again is kept so that pruning doesn't need the capacity and rate of every limit
+            self.buckets[key] = (tokens, now, now + (capacity - tokens) / rate)
+
+        return retry_after
+
+    def prune(self, now):
+        """ Drops the buckets that have refilled by now. The lock must be held """
+
+        self.buckets = dict((key, bucket) for key, bucket in self.buckets.items() if bucket[2] > now)
+        self.pruned_on = now
+
+
+class DatabaseBackend(object):
+    """ Token buckets kept in the rate_limit_bucket table
+    Limits are shared between all workers and dynos, at the cost of one statement per limited request
+    Every prune_seconds, each process deletes the rows that haven't been touched in max_seconds, the longest any bucket takes to refill
+    """
+
+    def __init__(self, max_seconds, prune_seconds=60):
+        self.max_seconds = max_seconds
+        self.prune_seconds = prune_seconds
+        self.pruned_on = time.monotonic()
+        self.lock = Lock()
+
+    def hit(self, key, capacity, rate):
+        """ Takes a token from the bucket for key
+        Returns 0 if the request is allowed, otherwise the number of seconds until a token is available
+        """
+
+        # The refill and the take are done in a single upsert so that concurrent workers can't both take the last token
+        # If the bucket has less than one token the WHERE clause stops the update, so no row is returned
+        # The database clock is used so that the workers don't need to agree on the time
+        refilled = "LEAST(:capacity, rate_limit_bucket.tokens + :rate * EXTRACT(EPOCH FROM now() - rate_limit_bucket.updated_on))"
+
+        row = db.session.execute(
+            "INSERT INTO rate_limit_bucket (key, tokens, updated_on) VALUES (:key, :capacity - 1, now()) " +
+            "ON CONFLICT (key) DO UPDATE SET tokens = " + refilled + " - 1, updated_on = now() " +
+            "WHERE " + refilled + " >= 1 " +
+            "RETURNING tokens",
+            {"key": key, "capacity": capacity, "rate": rate}
+        ).first()
+
+        if row is not None:
+            db.session.commit()
+            self.maybe_prune()
+
+            return 0
+
+        row = db.session.execute(
+            "SELECT " + refilled + " FROM rate_limit_bucket WHERE key = :key",
+            {"key": key, "capacity": capacity, "rate": rate}
+        ).first()
+        db.session.commit()
+
+        return (1 - float(row[0])) / rate
+
+    def maybe_prune(self):
+
+        # Only one thread per process prunes at a time, and the others carry on without waiting for it
+        if time.monotonic() - self.pruned_on < self.prune_seconds or not self.lock.acquire(False):
+            return
+
+        try:
+            self.pruned_on = time.monotonic()
+
+            db.session.execute(
+                "DELETE FROM rate_limit_bucket WHERE updated_on < now() - :seconds * INTERVAL '1 second'",
+                {"seconds": self.max_seconds}
+            )
+            db.session.commit()
+        finally:
+            self.lock.release()
+
+
+class RateLimiter(object):
+    """ Token bucket rate limiting per client ip and per route
+    Limits are read from the config as RATELIMIT_<NAME> = (requests, seconds)
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("RATELIMIT_ENABLED", True)
+        app.config.setdefault("RATELIMIT_STORAGE", "memory")
+        app.config.setdefault("RATELIMIT_PROXY_COUNT", 0)
+        app.config.setdefault("RATELIMIT_PRUNE_SECONDS", 60)
+
+        if app.config["RATELIMIT_STORAGE"] == "database":
+
+            # Limits are the RATELIMIT_ values that are (requests, seconds) pairs
+            # A bucket that hasn't been touched for the longest of their periods has refilled, whatever limit it's for
+            periods = [value[1] for key, value in app.config.items() if key.startswith("RATELIMIT_") and isinstance(value, tuple)]
+
+            backend = DatabaseBackend(max(periods + [0]), app.config["RATELIMIT_PRUNE_SECONDS"])
+        else:
+            backend = MemoryBackend(app.config["RATELIMIT_PRUNE_SECONDS"])
+
+        app.extensions["ratelimit"] = backend
+
+    def limit(self, name, methods=None):
+        """ Decorator limiting a route with the RATELIMIT_<NAME> config value
+        If methods is given, only requests with those methods are counted
+        """
+
+        def decorator(f):
+
+            @wraps(f)
+            def wrapped(*args, **kwargs):
+                if not current_app.config["RATELIMIT_ENABLED"] or (methods is not None and request.method not in methods):
+                    return f(*args, **kwargs)
+
+                requests, seconds = current_app.config["RATELIMIT_" + name.upper()]
+                key = "{}:{}".format(name, get_client_ip())
+
+                retry_after = current_app.extensions["ratelimit"].hit(key, requests, float(requests) / seconds)
+
+                if retry_after:
+                    response = jsonify({
+                        "status": "Failure",
+                        "message": "Rate limit exceeded. Try again in {} seconds".format(int(retry_after) + 1)
+                    })
+
+                    # make_response needs to be used to be able to specify the status code
+                    response = make_response((response, 429))
+                    response.headers["Retry-After"] = str(int(retry_after) + 1)
+
+                    return response
+
+                return f(*args, **kwargs)
+
+            return wrapped
+
+        return decorator
+
+
+def get_client_ip():
+    """ Returns the ip of the client making the current request
+    Behind RATELIMIT_PROXY_COUNT proxies (the Heroku router is one) the address is taken from X-Forwarded-For
+    Only the entries added by the trusted proxies are used, as anything before them can be set by the client
+    """
+
+    proxy_count = current_app.config["RATELIMIT_PROXY_COUNT"]
+
+    if proxy_count:
+        forwarded = [ip.strip() for ip in request.headers.get("X-Forwarded-For", "").split(",") if ip.strip()]
+
+        if len(forwarded) >= proxy_count:
+            return forwarded[-proxy_count]
+
+    return request.remote_addr
+
+
+limiter = RateLimiter()
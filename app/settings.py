@@ -11,6 +11,65 @@ class Config(object):
     IMAGE_NAME_LENGTH = 7
     IMAGES_PER_PAGE = 10
 
+    # Images are stored in nested directories (or S3 prefixes) named after the hash of their filename, as (levels, characters per level)
+    STORAGE_FANOUT = (2, 2)
+
+    # Resumable uploads. Chunks are copied UPLOAD_BLOCK_SIZE bytes at a time, and kept in UPLOAD_TEMP_FOLDER until they're finalized
+    UPLOAD_MAX_SIZE = 50 * 1024 * 1024
+    UPLOAD_BLOCK_SIZE = 64 * 1024
+    UPLOAD_TEMP_FOLDER = os.path.join(basedir, os.pardir, "uploads")
+
+    # Signed forms for direct uploads to S3 last this many seconds
+    # Finalizing reads the first DIRECT_UPLOAD_HEADER_SIZE bytes of the upload to check it's an image
+    # Direct uploads are re-encoded on a pool of this many threads per worker, or during the request if it's 0
+    DIRECT_UPLOAD_EXPIRES = 600
+    DIRECT_UPLOAD_HEADER_SIZE = 1024 * 1024
+    PROCESSING_WORKERS = 2
+
+    # Uploads are re-encoded at the lowest jpeg quality in this range that keeps them this similar (SSIM) to the original
+    # The search stops early once it has taken ENCODER_TIME_BUDGET seconds
+    ENCODER_QUALITY_MIN = 30
+    ENCODER_QUALITY_MAX = 90
+    ENCODER_SIMILARITY_TARGET = 0.95
+    ENCODER_TIME_BUDGET = 1.0
+
+    # Sampling profiler. 1 in PROFILER_SAMPLE_RATE requests are profiled, along with requests with a signed X-Profile header
+    PROFILER_ENABLED = False
+    PROFILER_SAMPLE_RATE = 0
+    PROFILER_OUTPUT_DIR = os.path.join(basedir, os.pardir, "profiles")
+
+    # Image views are counted in each worker, and written every VIEWS_FLUSH_SECONDS or VIEWS_FLUSH_COUNT views, whichever comes first
+    # Unique viewers are estimated with sketches of 2 ** VIEWS_SKETCH_PRECISION bytes per photo
+    VIEWS_ENABLED = True
+    VIEWS_FLUSH_SECONDS = 30
+    VIEWS_FLUSH_COUNT = 1000
+    VIEWS_SKETCH_PRECISION = 10
+
+    # Each unique viewer counts as this many votes in the hot sort. 0 ranks by votes alone
+    HOT_VIEWS_WEIGHT = 0.0
+
+    # Image totals are cached per worker, and estimated from planner statistics once the table has this many rows
+    IMAGES_COUNT_CACHE_SECONDS = 60
+    IMAGES_EXACT_COUNT_THRESHOLD = 10000
+
+    # Event stream limits per worker, and how often idle streams get a heartbeat
+    STREAM_MAX_SUBSCRIBERS = 1000
+    STREAM_MAX_QUEUED = 100
+    STREAM_HEARTBEAT_SECONDS = 20
+
+    # Refuse streams on workers that can only serve one request at a time, as each stream would hold a whole worker
+    STREAM_REQUIRE_ASYNC = False
+
+    # Rate limits as (requests, seconds) per client ip
+    RATELIMIT_ENABLED = True
+    RATELIMIT_STORAGE = "memory"
+    RATELIMIT_PROXY_COUNT = 0
+    RATELIMIT_UPLOAD = (10, 60)
+    RATELIMIT_UPVOTE = (30, 60)
+
+    # Buckets that have refilled are removed this often, so clients that have gone away don't take up memory or rows forever
+    RATELIMIT_PRUNE_SECONDS = 60
+
 
 class ProdConfig(Config):
     ENV = 'prod'
@@ -22,9 +81,25 @@ class ProdConfig(Config):
     S3_SECRET = os.environ.get("S3_SECRET")
     S3_UPLOAD_DIRECTORY = os.environ.get("S3_UPLOAD_DIRECTORY")
     S3_BUCKET = os.environ.get("S3_BUCKET")
+    S3_PENDING_DIRECTORY = os.environ.get("S3_PENDING_DIRECTORY", "pending")
+
+    # Only set to use an S3 compatible server other than Amazon
+    S3_HOST = os.environ.get("S3_HOST")
+    S3_PORT = int(os.environ["S3_PORT"]) if os.environ.get("S3_PORT") else None
+    S3_IS_SECURE = os.environ.get("S3_IS_SECURE", "1") == "1"
 
     ADMIN_PASSWORD = os.environ.get("ADMIN_PASSWORD")
 
+    # Buckets are stored in the database so the limits hold across all gunicorn workers
+    # The Heroku router adds one entry to X-Forwarded-For
+    RATELIMIT_STORAGE = "database"
+    RATELIMIT_PROXY_COUNT = 1
+
+    PROFILER_ENABLED = os.environ.get("PROFILER_ENABLED") == "1"
+    PROFILER_SAMPLE_RATE = int(os.environ.get("PROFILER_SAMPLE_RATE", 0))
+
+    STREAM_REQUIRE_ASYNC = True
+
 
 class DevConfig(Config):
     ENV = 'dev'
@@ -44,3 +119,9 @@ class TestConfig(Config):
     ADMIN_PASSWORD = "Password"
 
     IMAGE_FOLDER = IMAGE_FOLDER = os.path.join(basedir, os.pardir, "tests", "images")
+    UPLOAD_TEMP_FOLDER = os.path.join(basedir, os.pardir, "tests", "uploads")
+
+    PROCESSING_WORKERS = 0
+
+    # Views are written on every request, so tests can check them straight away
+    VIEWS_FLUSH_SECONDS = 0
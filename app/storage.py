@@ -0,0 +1,333 @@
+from datetime import datetime, timedelta
+from threading import local
+import tempfile
+import hashlib
+import base64
+import hmac
+import json
+import shutil
+import os
+
+# S3 connections are made per process, after gunicorn forks the workers, and reused for every request in that process
+# They're also kept per thread, as boto connections can't be shared between the threads of the storage migration
+_connections = local()
+
+
+def get_bucket(config):
+    """ Connects to Amazon S3 and returns the bucket images are stored in """
+
+    # boto is slow to import and only used in prod, so it's imported on the first call
+    import boto
+
+    # A connection made before a fork would have its socket shared with the parent, so a new one is made in each process
+    if getattr(_connections, "pid", None) != os.getpid():
+
+        # S3_HOST points boto at an S3 compatible server instead of Amazon, like a local stand-in for testing
+        if config.get("S3_HOST"):
+            from boto.s3.connection import OrdinaryCallingFormat
+
+            _connections.connection = boto.connect_s3(config["S3_KEY"], config["S3_SECRET"], host=config["S3_HOST"], port=config.get("S3_PORT"),
+                                                      is_secure=config.get("S3_IS_SECURE", True), calling_format=OrdinaryCallingFormat())
+        else:
+            _connections.connection = boto.connect_s3(config["S3_KEY"], config["S3_SECRET"])
+
+        _connections.pid = os.getpid()
+
+    # validate=False skips the request boto would make to check the bucket exists
+    return _connections.connection.get_bucket(config["S3_BUCKET"], validate=False)
+
+
+def sharded_path(filename, fanout):
+    """ Returns the path to store a file at, spread over nested directories named after the hash of the filename
+    fanout is (levels, width), so (2, 2) gives paths like ab/cd/filename
+    Thousands of files in one directory make lookups slow on disk, and S3 limits the request rate per prefix
+    """
+
+    levels, width = fanout
+    digest = hashlib.md5(filename.encode("utf-8")).hexdigest()
+
+    return "/".join([digest[i * width:(i + 1) * width] for i in range(levels)] + [filename])
+
+
+def image_path(photo):
+    """ Returns the path the image of a photo is stored at
+    Photos from before sharding, or that haven't been migrated yet, are stored flat at their filename
+    """
+
+    return photo.storage_path or photo.filename
+
+
+def image_fallback(config, photo):
+    """ Returns the other path the image of a photo might be at, if it isn't at image_path
+    A photo that hadn't been moved to its sharded path when its row was loaded may have been moved (and its flat copy deleted) since
+    Photos with a storage path are never moved again, so they have no fallback
+    """
+
+    if photo.storage_path:
+        return None
+
+    return sharded_path(photo.filename, config["STORAGE_FANOUT"])
+
+
+def s3_key_name(config, path):
+    return "/".join([config["S3_UPLOAD_DIRECTORY"], path])
+
+
+def local_path(config, path):
+    return os.path.join(config["IMAGE_FOLDER"], *path.split("/"))
+
+
+def find_local_image(config, path, fallback=None):
+    """ Returns the location on disk of the image stored at path, or at fallback if it isn't there
+    The fallback is the flat path, so images can still be found while they're being moved
+    """
+
+    if fallback is not None and not os.path.isfile(local_path(config, path)):
+        return local_path(config, fallback)
+
+    return local_path(config, path)
+
+
+def open_image(config, path, fallback=None):
+    """ Returns a file object for reading the image stored at path, or at fallback if it isn't there """
+
+    # Prod connects to Amazon S3
+    if config["ENV"] == "prod":
+        bucket = get_bucket(config)
+
+        # Get the image with the matching path and open it to read
+        item = bucket.get_key(s3_key_name(config, path))
+
+        if item is None and fallback is not None:
+            item = bucket.get_key(s3_key_name(config, fallback))
+
+        # A missing key is returned as None, so it's raised the same way a missing local file would be
+        if item is None:
+            raise IOError("No such key: {}".format(path))
+
+        item.open_read()
+
+        return item
+
+    return open(find_local_image(config, path, fallback), "rb")
+
+
+def get_image_info(config, path):
+    """ Returns the size and content type of the image stored at path in S3, or None if there's nothing there """
+
+    item = get_bucket(config).get_key(s3_key_name(config, path))
+
+    if item is None:
+        return None
+
+    return item.size, item.content_type
+
+
+def read_image_header(config, path, length):
+    """ Returns the first length bytes of the image stored at path in S3, without downloading the rest of it """
+
+    item = get_bucket(config).get_key(s3_key_name(config, path))
+
+    if item is None:
+        raise IOError("No such key: {}".format(path))
+
+    return item.get_contents_as_string(headers={"Range": "bytes=0-{}".format(length - 1)})
+
+
+def presign_post(config, path, max_size, expires):
+    """ Returns the url and form fields a browser can use to upload an image straight to path in S3
+    The signed policy only allows that one key, images up to max_size bytes, and expires after the specified number of seconds
+    """
+
+    key = s3_key_name(config, path)
+    expiration = datetime.utcnow() + timedelta(seconds=expires)
+
+    # boto's build_post_form_args can't encode the policy on python 3, so it's built and signed here the same way
+    policy = base64.b64encode(json.dumps({
+        "expiration": expiration.strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "conditions": [
+            {"bucket": config["S3_BUCKET"]},
+            {"key": key},
+            {"acl": "public-read"},
+            ["starts-with", "$Content-Type", "image/"],
+            ["content-length-range", 0, max_size]
+        ]
+    }).encode("utf-8"))
+
+    signature = base64.b64encode(hmac.new(config["S3_SECRET"].encode("utf-8"), policy, hashlib.sha1).digest())
+
+    if config.get("S3_HOST"):
+        host = config["S3_HOST"] + (":{}".format(config["S3_PORT"]) if config.get("S3_PORT") else "")
+        url = "{}://{}/{}/".format("https" if config.get("S3_IS_SECURE", True) else "http", host, config["S3_BUCKET"])
+    else:
+        url = "https://{}.s3.amazonaws.com/".format(config["S3_BUCKET"])
+
+    # The browser has to add a Content-Type field with the type of the image, along with the file itself
+    return url, {
+        "key": key,
+        "acl": "public-read",
+        "AWSAccessKeyId": config["S3_KEY"],
+        "policy": policy.decode("ascii"),
+        "signature": signature.decode("ascii")
+    }
+
+
+def save_image(config, data, path, mimetype):
+    """ Stores the image data at path """
+
+    # Prod connects to Amazon S3
+    if config["ENV"] == "prod":
+
+        # An s3 "key" is basically a file name
+        # The file is made publically readable in the same request so that all users can view it
+        key = get_bucket(config).new_key(s3_key_name(config, path))
+        key.set_contents_from_string(data, headers={"Content-Type": mimetype}, policy="public-read")
+
+    else:
+        destination = local_path(config, path)
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+
+        with open(destination, "wb") as f:
+            f.write(data)
+
+
+def copy_image(config, source, destination):
+    """ Copies the image stored at source to destination, leaving the original in place """
+
+    if config["ENV"] == "prod":
+
+        # The copy happens inside of S3, so the image doesn't have to be downloaded and uploaded again
+        get_bucket(config).copy_key(s3_key_name(config, destination), config["S3_BUCKET"], s3_key_name(config, source), preserve_acl=True)
+
+    else:
+        destination = local_path(config, destination)
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+
+        shutil.copy2(local_path(config, source), destination)
+
+
+def delete_image(config, path):
+    if config["ENV"] == "prod":
+        get_bucket(config).delete_key(s3_key_name(config, path))
+    else:
+        os.remove(local_path(config, path))
+
+
+# Resumable uploads are stored here until they're finalized
+# Locally they're temporary files, in prod they're S3 multipart uploads so that any dyno can take the next chunk
+
+# S3 rejects multipart parts smaller than this, other than the last one
+S3_MIN_PART_SIZE = 5 * 1024 * 1024
+
+
+def pending_key_name(config, upload_id):
+    return "/".join([config["S3_PENDING_DIRECTORY"], upload_id])
+
+
+def pending_local_path(config, upload_id):
+    return os.path.join(config["UPLOAD_TEMP_FOLDER"], upload_id)
+
+
+def get_multipart_upload(config, upload_id, multipart_id):
+    """ Returns the boto object for an S3 multipart upload that was started by another request """
+
+    from boto.s3.multipart import MultiPartUpload
+
+    multipart = MultiPartUpload(get_bucket(config))
+    multipart.key_name = pending_key_name(config, upload_id)
+    multipart.id = multipart_id
+
+    return multipart
+
+
+def start_pending_upload(config, upload_id):
+    """ Creates the storage for a resumable upload
+    Returns the id of the S3 multipart upload in prod, and None locally
+    """
+
+    if config["ENV"] == "prod":
+        return get_bucket(config).initiate_multipart_upload(pending_key_name(config, upload_id)).id
+
+    os.makedirs(config["UPLOAD_TEMP_FOLDER"], exist_ok=True)
+    open(pending_local_path(config, upload_id), "wb").close()
+
+    return None
+
+
+def spool_chunk(config, stream, length):
+    """ Copies up to length bytes from stream to a temporary file, so the chunk can be stored without waiting on the client
+    The stream is copied in blocks of UPLOAD_BLOCK_SIZE, so memory use doesn't depend on the size of the chunk
+    Returns the file, rewound to the start, and the number of bytes in it, which is less than length if the client disconnected
+    """
+
+    chunk = tempfile.TemporaryFile()
+    written = 0
+
+    while written < length:
+        block = stream.read(min(config["UPLOAD_BLOCK_SIZE"], length - written))
+
+        # The client disconnected before sending the whole chunk
+        if not block:
+            break
+
+        chunk.write(block)
+        written += len(block)
+
+    chunk.seek(0)
+
+    return chunk, written
+
+
+def write_pending_chunk(config, upload_id, multipart_id, part_number, chunk, start, length):
+    """ Writes a spooled chunk of length bytes to a resumable upload, starting at byte start """
+
+    if config["ENV"] == "prod":
+        get_multipart_upload(config, upload_id, multipart_id).upload_part_from_file(chunk, part_number, size=length)
+    else:
+        with open(pending_local_path(config, upload_id), "r+b") as target:
+            target.seek(start)
+            shutil.copyfileobj(chunk, target, config["UPLOAD_BLOCK_SIZE"])
+
+
+def open_pending_upload(config, upload_id, multipart_id):
+    """ Returns a file object for reading a complete resumable upload
+    Completing the S3 multipart upload is skipped if an earlier finalize already did it, so finalizing can be retried
+    """
+
+    if config["ENV"] == "prod":
+        key = get_bucket(config).get_key(pending_key_name(config, upload_id))
+
+        if key is None:
+            get_multipart_upload(config, upload_id, multipart_id).complete_upload()
+            key = get_bucket(config).get_key(pending_key_name(config, upload_id))
+
+        # The upload is downloaded to disk rather than memory, as it can be large
+        data = tempfile.TemporaryFile()
+        key.get_contents_to_file(data)
+        data.seek(0)
+
+        return data
+
+    return open(pending_local_path(config, upload_id), "rb")
+
+
+def delete_pending_upload(config, upload_id, multipart_id, completed=False):
+    """ Deletes the storage of a resumable upload, after it's finalized or abandoned """
+
+    if config["ENV"] == "prod":
+        from boto.exception import S3ResponseError
+
+        if not completed:
+            try:
+                get_multipart_upload(config, upload_id, multipart_id).cancel_upload()
+            except S3ResponseError as e:
+
+                # A finalize that failed after completing the multipart upload leaves an object instead, which is deleted below
+                if e.status != 404:
+                    raise
+
+        # Deleting a key that doesn't exist succeeds, so this is safe either way
+        get_bucket(config).delete_key(pending_key_name(config, upload_id))
+
+    elif os.path.isfile(pending_local_path(config, upload_id)):
+        os.remove(pending_local_path(config, upload_id))
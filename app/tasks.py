@@ -0,0 +1,49 @@
+from concurrent.futures import ThreadPoolExecutor
+import os
+
+from .events import is_async_worker
+
+# Work that shouldn't hold up a request is run on a pool of threads in each process
+# Like the S3 connections, the pool is made after gunicorn forks, as threads don't survive a fork
+_executor = None
+_executor_pid = None
+
+
+def run_in_background(app, workers, func, *args):
+    """ Runs func with args in an app context on the background pool of this process
+    With workers set to 0 it's run straight away instead, which keeps tests deterministic
+    """
+
+    global _executor, _executor_pid
+
+    def run():
+        with app.app_context():
+            try:
+                func(*args)
+            except Exception:
+                app.logger.exception("Background task {} failed".format(func.__name__))
+
+    if not workers:
+        run()
+        return
+
+    if _executor is None or _executor_pid != os.getpid():
+        _executor = ThreadPoolExecutor(max_workers=workers)
+        _executor_pid = os.getpid()
+
+    _executor.submit(run)
+
+
+def run_blocking(func, *args):
+    """ Runs func with args on a real thread and returns its result, for work that keeps the CPU busy, like encoding images
+    Under gevent every request and stream of a worker shares one thread, which would stall for the whole encode
+    gevent's thread pool runs it on an OS thread instead, and Pillow releases the GIL while it decodes, encodes and resizes
+    Other workers don't have that problem, so it's just called
+    """
+
+    if not is_async_worker():
+        return func(*args)
+
+    from gevent import get_hub
+
+    return get_hub().threadpool.apply(func, args)
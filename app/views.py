@@ -0,0 +1,786 @@
+from flask import Blueprint, Response, current_app, request, jsonify, make_response, send_file, render_template, url_for
+
+from .models import db, Photo, Upload
+from .ratelimit import limiter
+from .lib import create_photo, process_photo, generate_filename, parse_content_range, paginate, count_images, get_images_sort_old, get_images_sort_new, get_images_sort_hot
+from .storage import image_path, image_fallback, open_image, find_local_image, start_pending_upload, spool_chunk, write_pending_chunk, open_pending_upload, delete_pending_upload, S3_MIN_PART_SIZE
+from .storage import sharded_path, presign_post, get_image_info, read_image_header, delete_image
+from .tasks import run_in_background
+from .encoder import InvalidImage, identify_image
+from itsdangerous import URLSafeTimedSerializer, BadSignature
+from werkzeug.utils import secure_filename
+from sqlalchemy.exc import IntegrityError
+from .events import broker, publish, is_async_worker
+from .counters import view_counter
+import binascii
+import os
+
+# All of the routes are registered on this blueprint when it's imported, so creating an app only has to register the blueprint
+main = Blueprint("main", __name__)
+
+
+# TEMPLATE ROUTES ==============================================================================================================================================================
+
+
+@main.route("/")
+def index():
+    return render_template("index.html")
+
+
+@main.route("/images")
+def images():
+
+    # Defaults to page 1
+    page = 1
+
+    # Checks if there's a page argument, and makes sure it's valid
+    if "page" in request.args.keys():
+        try:
+            page = int(request.args["page"])
+        except ValueError:
+            response = jsonify({
+                "status": "Failure",
+                "message": "Invalid page number"
+            })
+
+            # make_response needs to be used to be able to specify the status code
+            return make_response((response, 400))
+
+    # The offset needs to be page - 1 because if not, it would be offset by IMAGES_PER_PAGE on the 1st page, and 2 * IMAGES_PER_PAGE on the 2nd one
+    # The offset should actually be 0 for the 1st page and IMAGES_PER_PAGE for the 2nd
+    page -= 1
+
+    if page < 0:
+        page = 0
+
+    # Checks if there's a sort argument, and makes sure it's valid
+    if "sort" in request.args.keys() and request.args["sort"].lower() != "old" and request.args["sort"].lower() != "new" and request.args["sort"].lower() != "hot":
+        response = jsonify({
+            "status": "Failure",
+            "message": "Invalid sort method"
+        })
+
+        # make_response needs to be used to be able to specify the status code
+        return make_response((response, 400))
+
+    if "sort" not in request.args or request.args["sort"].lower() == "old":
+
+        # Default to sorting by creation date
+        images = get_images_sort_old(page, current_app.config["IMAGES_PER_PAGE"])
+        sort = "old"
+    elif request.args["sort"].lower() == "new":
+
+        # Sort by reverse creation date, so new -> old
+        images = get_images_sort_new(page, current_app.config["IMAGES_PER_PAGE"])
+        sort = "new"
+    else:
+
+        # Sort by the hot sort algorithm
+        images = get_images_sort_hot(page, current_app.config["IMAGES_PER_PAGE"], current_app.config["HOT_VIEWS_WEIGHT"])
+        sort = "hot"
+
+    images, has_more = paginate(images, current_app.config["IMAGES_PER_PAGE"])
+
+    results = []
+
+    # Loop through images and create the data to render the template with
+    for image in images:
+        results.append({
+            "id": image.id,
+            "title": image.title,
+            "image_url": url_for(".api_return_image", image_id=image.id, _external=True),
+            "placeholder": image.placeholder,
+            "votes": image.votes,
+        })
+
+    # Page is increased by one because it becomes decremented by one after the submission
+    return render_template("images.html", images=results, sort=sort, header=sort.capitalize(), page=page + 1, has_more=has_more)
+
+
+@main.route("/upload")
+def upload():
+    return render_template("upload.html")
+
+
+# API ROUTES ===================================================================================================================================================================
+
+
+# A basic route to test if the API is working
+@main.route("/api")
+def api_index():
+    return jsonify({
+        "status": "Success",
+        "message": "Welcome to the API! For specs on the routes, check the readme at https://github.com/PaulOlteanu/Shamrok"
+    })
+
+
+# Images route. Allows users to get all images, or to upload an image
+@main.route("/api/images", methods=["GET", "POST"])
+@limiter.limit("upload", methods=["POST"])
+def api_images():
+
+    # GET route. Returns all images sorted by the specified method, or defaults to oldest -> newest
+    # Split into pages of current_app.config["IMAGES_PER_PAGE"], which is usually 10
+    if request.method == "GET":
+
+        # Defaults to page 1
+        page = 1
+
+        # Checks if there's a page argument, and makes sure it's valid
+        if "page" in request.args.keys():
+            try:
+                page = int(request.args["page"])
+            except ValueError:
+                response = jsonify({
+                    "status": "Failure",
+                    "message": "Invalid page number"
+                })
+
+                # make_response needs to be used to be able to specify the status code
+                return make_response((response, 400))
+
+        # The offset needs to be page - 1 because if not, it would be offset by IMAGES_PER_PAGE on the 1st page, and 2 * IMAGES_PER_PAGE on the 2nd one
+        # The offset should actually be 0 for the 1st page and IMAGES_PER_PAGE for the 2nd
+        page -= 1
+
+        if page < 0:
+            page = 0
+
+        # Checks if there's a sort argument, and makes sure it's valid
+        if "sort" in request.args.keys() and request.args["sort"].lower() != "new" and request.args["sort"].lower() != "hot":
+            response = jsonify({
+                "status": "Failure",
+                "message": "Invalid sort method"
+            })
+
+            # make_response needs to be used to be able to specify the status code
+            return make_response((response, 400))
+
+        if "sort" not in request.args:
+
+            # Default to sorting by creation date
+            images = get_images_sort_old(page, current_app.config["IMAGES_PER_PAGE"])
+        elif request.args["sort"].lower() == "new":
+
+            # Sort by reverse creation date, so new -> old
+            images = get_images_sort_new(page, current_app.config["IMAGES_PER_PAGE"])
+        else:
+
+            # Sort by the hot sort algorithm
+            images = get_images_sort_hot(page, current_app.config["IMAGES_PER_PAGE"], current_app.config["HOT_VIEWS_WEIGHT"])
+
+        images, has_more = paginate(images, current_app.config["IMAGES_PER_PAGE"])
+
+        results = []
+
+        # Loop through images and create the response
+        for image in images:
+            results.append({
+                "id": image.id,
+                "title": image.title,
+                "filename": image.filename,
+                "mimetype": image.mimetype,
+                "votes": image.votes,
+                "views": image.views,
+                "unique_viewers": image.unique_viewers,
+                "width": image.width,
+                "height": image.height,
+                "placeholder": image.placeholder,
+                "creation_date": image.created_on
+            })
+
+        response = {
+            "status": "Success",
+            "data": results,
+            "page": page + 1,
+            "has_more": has_more
+        }
+
+        # The total is only counted when it's asked for, and may be an estimate on large tables
+        if request.args.get("total", "").lower() in ["1", "true"]:
+            response["total"], response["total_approximate"] = count_images(current_app.config["IMAGES_COUNT_CACHE_SECONDS"], current_app.config["IMAGES_EXACT_COUNT_THRESHOLD"])
+
+        return jsonify(response)
+
+    # POST route. Images are uploaded here
+    # The input must be form encoded data, consisting of an image, and a title
+    elif request.method == "POST":
+
+        # Make sure the file exists
+        # The "key" for it must be "file", otherwise it will not be accepted
+        if "file" not in request.files:
+            response = jsonify({
+                "status": "Failure",
+                "message": "File missing"
+            })
+
+            # make_response needs to be used to be able to specify the status code
+            return make_response((response, 400))
+
+        upload = request.files["file"]
+
+        # Make sure the file extension is valid
+        if upload.filename.split(".")[-1] not in ["png", "jpg", "bmp", "jpeg"]:
+            response = jsonify({
+                "status": "Failure",
+                "message": "Invalid file extension"
+            })
+
+            # make_response needs to be used to be able to specify the status code
+            return make_response((response, 400))
+
+        # Make sure a title is present
+        if "title" not in request.form.keys():
+            response = jsonify({
+                "status": "Failure",
+                "message": "Title missing"
+            })
+
+            # make_response needs to be used to be able to specify the status code
+            return make_response((response, 400))
+        else:
+            title = request.form["title"]
+
+        try:
+            photo, stats = create_photo(upload.stream, title, current_app.config)
+        except InvalidImage:
+            response = jsonify({
+                "status": "Failure",
+                "message": "Invalid image"
+            })
+
+            # make_response needs to be used to be able to specify the status code
+            return make_response((response, 400))
+
+        current_app.logger.info("Encoded photo {} as {} in {} ms, saving {} bytes".format(photo.id, stats["format"], stats["encode_ms"], stats["bytes_saved"]))
+
+        return jsonify({
+            "status": "Success",
+            "encoding": stats
+        })
+
+
+@main.route("/api/images/<int:image_id>")
+def api_return_image(image_id):
+    photo = Photo.query.filter_by(id=image_id).first()
+
+    # Make sure the image with the specified id exists
+    if not photo:
+        response = jsonify({
+            "status": "Failure",
+            "message": "Photo id does not exist"
+        })
+
+        # make_response needs to be used to be able to specify the status code
+        return make_response((response, 400))
+
+    # Prod streams the image from Amazon S3
+    if current_app.config["ENV"] == "prod":
+
+        # Send the file, along with the stored mimetype
+        # Falls back to the sharded path in case the image was moved after the photo was loaded
+        response = send_file(open_image(current_app.config, image_path(photo), fallback=image_fallback(current_app.config, photo)), mimetype=photo.mimetype)
+
+    else:
+
+        # Send the file by matching the database path to the one on disk
+        # Avoids having to load it
+        response = send_file(find_local_image(current_app.config, image_path(photo), fallback=image_fallback(current_app.config, photo)), mimetype=photo.mimetype)
+
+    # Views are counted in memory and written in batches, so fetching an image doesn't usually write to the database
+    # It's counted once the response is built, as a flush commits the session and would make the photo load again
+    view_counter.count_view(photo.id)
+
+    return response
+
+
+# Route to upvote an image
+@main.route("/api/images/upvote/<int:image_id>", methods=["POST"])
+@limiter.limit("upvote")
+def api_upvote(image_id):
+    photo = Photo.query.filter_by(id=image_id).first()
+
+    # Make sure the image with the specefied id exists
+    if not photo:
+        response = jsonify({
+            "status": "Failure",
+            "message": "Photo id does not exist"
+        })
+
+        # make_response needs to be used to be able to specify the status code
+        return make_response((response, 400))
+
+    # Upvote the image and save it to the database
+    photo.votes += 1
+    db.session.flush()
+
+    # Let the stream subscribers know about the new vote count once it's committed
+    publish("vote", {"id": photo.id, "votes": photo.votes})
+
+    db.session.commit()
+
+    return jsonify({
+        "status": "Success",
+        "message": "Upvoted image"
+    })
+
+
+# Resumable uploads
+# An upload is created with its title, filename and length, then its bytes are sent in chunks with PUT requests
+# If a chunk is cut off, the client asks for the offset that was stored and continues from there
+# Once every byte has been sent, finalizing it creates the photo the same way as a single request upload
+@main.route("/api/uploads", methods=["POST"])
+@limiter.limit("upload")
+def api_create_upload():
+
+    # Make sure the file extension is valid
+    if request.form.get("filename", "").split(".")[-1] not in ["png", "jpg", "bmp", "jpeg"]:
+        response = jsonify({
+            "status": "Failure",
+            "message": "Invalid file extension"
+        })
+
+        # make_response needs to be used to be able to specify the status code
+        return make_response((response, 400))
+
+    # Make sure a title is present
+    if "title" not in request.form.keys():
+        response = jsonify({
+            "status": "Failure",
+            "message": "Title missing"
+        })
+
+        # make_response needs to be used to be able to specify the status code
+        return make_response((response, 400))
+
+    # Make sure the length is valid
+    try:
+        length = int(request.form.get("length", ""))
+    except ValueError:
+        length = 0
+
+    if length <= 0 or length > current_app.config["UPLOAD_MAX_SIZE"]:
+        response = jsonify({
+            "status": "Failure",
+            "message": "Invalid length"
+        })
+
+        # make_response needs to be used to be able to specify the status code
+        return make_response((response, 400))
+
+    # The id is all that's needed to add to the upload, so it's random rather than sequential
+    upload_id = binascii.hexlify(os.urandom(16)).decode("ascii")
+
+    upload = Upload(id=upload_id, title=request.form["title"], length=length, multipart_id=start_pending_upload(current_app.config, upload_id))
+    db.session.add(upload)
+    db.session.commit()
+
+    response = jsonify({
+        "status": "Success",
+        "id": upload.id,
+        "offset": upload.offset
+    })
+
+    # make_response needs to be used to be able to specify the status code
+    return make_response((response, 201))
+
+
+@main.route("/api/uploads/<upload_id>", methods=["GET", "PUT"])
+def api_upload(upload_id):
+
+    upload = Upload.query.filter_by(id=upload_id).first()
+
+    # Make sure the upload with the specified id exists
+    if not upload:
+        response = jsonify({
+            "status": "Failure",
+            "message": "Upload id does not exist"
+        })
+
+        # make_response needs to be used to be able to specify the status code
+        return make_response((response, 404))
+
+    # GET route. Returns how many bytes have been stored, which is where the next chunk should start
+    if request.method == "GET":
+        response = jsonify({
+            "status": "Success",
+            "offset": upload.offset,
+            "length": upload.length
+        })
+        response.headers["Upload-Offset"] = str(upload.offset)
+
+        return response
+
+    # PUT route. Stores a chunk of the upload, which is described by the Content-Range header
+    content_range = parse_content_range(request.headers.get("Content-Range"))
+
+    if content_range is None or content_range[2] != upload.length:
+        response = jsonify({
+            "status": "Failure",
+            "message": "Invalid Content-Range"
+        })
+
+        # make_response needs to be used to be able to specify the status code
+        return make_response((response, 400))
+
+    start, end, total = content_range
+
+    # Chunks have to be sent in order, without gaps or overlaps
+    if start != upload.offset:
+        response = jsonify({
+            "status": "Failure",
+            "message": "Chunk doesn't start at the current offset",
+            "offset": upload.offset
+        })
+
+        # make_response needs to be used to be able to specify the status code
+        return make_response((response, 409))
+
+    # S3 needs every part but the last to be at least 5MB
+    if current_app.config["ENV"] == "prod" and end + 1 < total and end + 1 - start < S3_MIN_PART_SIZE:
+        response = jsonify({
+            "status": "Failure",
+            "message": "Chunks must be at least {} bytes".format(S3_MIN_PART_SIZE)
+        })
+
+        # make_response needs to be used to be able to specify the status code
+        return make_response((response, 400))
+
+    multipart_id = upload.multipart_id
+    part_number = upload.parts + 1
+    offset = start
+
+    # The chunk can take a long time to arrive, so the connection goes back to the pool before reading it
+    db.session.commit()
+
+    chunk, written = spool_chunk(current_app.config, request.stream, end + 1 - start)
+
+    with chunk:
+
+        # S3 parts can't be added to later, so in prod a chunk that was cut off is dropped and has to be sent again
+        if written == end + 1 - start or (written and current_app.config["ENV"] != "prod"):
+
+            # The offset only moves if no other request has moved it since the chunk was checked
+            # The update locks the row until the commit, so a request for the same offset waits, then updates nothing
+            updated = Upload.query.filter_by(id=upload_id, offset=start).update({
+                "offset": start + written,
+                "parts": Upload.parts + 1
+            }, synchronize_session=False)
+
+            if not updated:
+                db.session.rollback()
+                upload = Upload.query.filter_by(id=upload_id).first()
+
+                response = jsonify({
+                    "status": "Failure",
+                    "message": "Chunk doesn't start at the current offset",
+                    "offset": upload.offset if upload else None
+                })
+
+                # make_response needs to be used to be able to specify the status code
+                return make_response((response, 409))
+
+            # The chunk is stored before the offset is committed, so a failed write leaves the offset where it was
+            try:
+                write_pending_chunk(current_app.config, upload_id, multipart_id, part_number, chunk, start, written)
+            except Exception:
+                db.session.rollback()
+                raise
+
+            db.session.commit()
+            offset = start + written
+
+    response = jsonify({
+        "status": "Success",
+        "offset": offset
+    })
+    response.headers["Upload-Offset"] = str(offset)
+
+    return response
+
+
+@main.route("/api/uploads/<upload_id>/finalize", methods=["POST"])
+def api_finalize_upload(upload_id):
+    upload = Upload.query.with_for_update().filter_by(id=upload_id).first()
+
+    # Make sure the upload with the specified id exists
+    if not upload:
+        response = jsonify({
+            "status": "Failure",
+            "message": "Upload id does not exist"
+        })
+
+        # make_response needs to be used to be able to specify the status code
+        return make_response((response, 404))
+
+    # Make sure every byte has been sent
+    if upload.offset != upload.length:
+        response = jsonify({
+            "status": "Failure",
+            "message": "Upload is incomplete",
+            "offset": upload.offset
+        })
+
+        # make_response needs to be used to be able to specify the status code
+        return make_response((response, 409))
+
+    # The upload is deleted in the same commit that creates the photo, so finalizing twice can't create two photos
+    db.session.delete(upload)
+
+    with open_pending_upload(current_app.config, upload.id, upload.multipart_id) as image_file:
+        try:
+            photo, stats = create_photo(image_file, upload.title, current_app.config)
+        except InvalidImage:
+            photo = None
+
+    # An upload that isn't an image can't be fixed by finalizing it again, so it's removed like a finalized one
+    if photo is None:
+        db.session.commit()
+        delete_pending_upload(current_app.config, upload.id, upload.multipart_id, completed=True)
+
+        response = jsonify({
+            "status": "Failure",
+            "message": "Invalid image"
+        })
+
+        # make_response needs to be used to be able to specify the status code
+        return make_response((response, 400))
+
+    delete_pending_upload(current_app.config, upload.id, upload.multipart_id, completed=True)
+
+    current_app.logger.info("Encoded photo {} as {} in {} ms, saving {} bytes".format(photo.id, stats["format"], stats["encode_ms"], stats["bytes_saved"]))
+
+    return jsonify({
+        "status": "Success",
+        "id": photo.id,
+        "encoding": stats
+    })
+
+
+# Direct uploads
+# In prod, browsers can upload straight to S3 with a signed form, so the image doesn't pass through a worker
+# Finalizing checks the image is there and creates the photo, and the image is re-encoded in the background
+DIRECT_UPLOAD_MIMETYPES = ["image/png", "image/jpeg", "image/bmp"]
+
+
+def direct_upload_serializer():
+
+    # The salt keeps tokens for direct uploads from being valid anywhere else SECRET_KEY signs things
+    return URLSafeTimedSerializer(current_app.config["SECRET_KEY"], salt="direct-upload")
+
+
+@main.route("/api/uploads/direct", methods=["POST"])
+@limiter.limit("upload")
+def api_direct_upload():
+
+    # Direct uploads go to S3, so they're only available in prod
+    if current_app.config["ENV"] != "prod":
+        response = jsonify({
+            "status": "Failure",
+            "message": "Direct uploads need S3"
+        })
+
+        # make_response needs to be used to be able to specify the status code
+        return make_response((response, 400))
+
+    extension = request.form.get("filename", "").split(".")[-1]
+
+    # Make sure the file extension is valid
+    if extension not in ["png", "jpg", "bmp", "jpeg"]:
+        response = jsonify({
+            "status": "Failure",
+            "message": "Invalid file extension"
+        })
+
+        # make_response needs to be used to be able to specify the status code
+        return make_response((response, 400))
+
+    # Make sure a title is present
+    if "title" not in request.form.keys():
+        response = jsonify({
+            "status": "Failure",
+            "message": "Title missing"
+        })
+
+        # make_response needs to be used to be able to specify the status code
+        return make_response((response, 400))
+
+    # The key is picked here rather than by the client, and the signed form only allows that key
+    filename = secure_filename(generate_filename(current_app.config["IMAGE_NAME_LENGTH"]) + "." + extension)
+    url, fields = presign_post(current_app.config, sharded_path(filename, current_app.config["STORAGE_FANOUT"]), current_app.config["UPLOAD_MAX_SIZE"], current_app.config["DIRECT_UPLOAD_EXPIRES"])
+
+    return jsonify({
+        "status": "Success",
+        "url": url,
+        "fields": fields,
+        "token": direct_upload_serializer().dumps({"filename": filename, "title": request.form["title"]})
+    })
+
+
+@main.route("/api/uploads/direct/finalize", methods=["POST"])
+def api_finalize_direct_upload():
+
+    # The token says which key was signed for, and the title, so neither can be changed by the client
+    try:
+        upload = direct_upload_serializer().loads(request.form.get("token", ""), max_age=current_app.config["DIRECT_UPLOAD_EXPIRES"] * 2)
+    except BadSignature:
+        response = jsonify({
+            "status": "Failure",
+            "message": "Invalid token"
+        })
+
+        # make_response needs to be used to be able to specify the status code
+        return make_response((response, 400))
+
+    # Make sure the upload hasn't already been finalized
+    # This is checked against the filename that was signed for, as processing can rename the photo and delete the uploaded image
+    if Photo.query.filter_by(upload_filename=upload["filename"]).first():
+        response = jsonify({
+            "status": "Failure",
+            "message": "Upload already finalized"
+        })
+
+        # make_response needs to be used to be able to specify the status code
+        return make_response((response, 409))
+
+    storage_path = sharded_path(upload["filename"], current_app.config["STORAGE_FANOUT"])
+    info = get_image_info(current_app.config, storage_path)
+
+    # Make sure the image was uploaded
+    if info is None:
+        response = jsonify({
+            "status": "Failure",
+            "message": "Image not uploaded"
+        })
+
+        # make_response needs to be used to be able to specify the status code
+        return make_response((response, 400))
+
+    size, mimetype = info
+
+    # The policy already limits these, but they're checked again in case it was made with different settings
+    valid = size <= current_app.config["UPLOAD_MAX_SIZE"] and mimetype in DIRECT_UPLOAD_MIMETYPES
+
+    # The content type is whatever the browser sent, so the start of the file is read to make sure it's really that type of image
+    # The image is served as uploaded until it's processed, so anything else could be served from the site as an image
+    if valid:
+        try:
+            valid = identify_image(read_image_header(current_app.config, storage_path, current_app.config["DIRECT_UPLOAD_HEADER_SIZE"])) == mimetype
+        except InvalidImage:
+            valid = False
+
+    if not valid:
+        delete_image(current_app.config, storage_path)
+
+        response = jsonify({
+            "status": "Failure",
+            "message": "Invalid image"
+        })
+
+        # make_response needs to be used to be able to specify the status code
+        return make_response((response, 400))
+
+    # Create a database entry for the new image, which is served as uploaded until it's processed
+    photo = Photo(title=upload["title"], filename=upload["filename"], mimetype=mimetype, storage_path=storage_path, processed=False, upload_filename=upload["filename"])
+    db.session.add(photo)
+
+    # Flush to get the id of the photo for the event, which is sent when the photo is committed
+    # upload_filename is unique, so a finalize running at the same time as this one fails here instead of creating a second photo
+    try:
+        db.session.flush()
+        publish("photo", {"id": photo.id, "title": photo.title, "votes": photo.votes, "width": photo.width, "height": photo.height})
+
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+
+        response = jsonify({
+            "status": "Failure",
+            "message": "Upload already finalized"
+        })
+
+        # make_response needs to be used to be able to specify the status code
+        return make_response((response, 409))
+
+    # The id is kept as processing can end the session the photo belongs to
+    photo_id = photo.id
+
+    run_in_background(current_app._get_current_object(), current_app.config["PROCESSING_WORKERS"], process_photo, photo_id, current_app.config)
+
+    return jsonify({
+        "status": "Success",
+        "id": photo_id
+    })
+
+
+# Server sent events stream of new photos and vote changes
+@main.route("/api/stream")
+def api_stream():
+
+    # On a sync worker a stream would take the whole worker until the client disconnects, so a few clients could take down the site
+    if current_app.config["STREAM_REQUIRE_ASYNC"] and not is_async_worker():
+        response = jsonify({
+            "status": "Failure",
+            "message": "Streaming is unavailable"
+        })
+
+        # make_response needs to be used to be able to specify the status code
+        return make_response((response, 503))
+
+    # Each subscriber holds a connection open, so the number per worker is capped
+    if broker.count() >= current_app.config["STREAM_MAX_SUBSCRIBERS"]:
+        response = jsonify({
+            "status": "Failure",
+            "message": "Too many subscribers. Try again later"
+        })
+
+        # make_response needs to be used to be able to specify the status code
+        return make_response((response, 503))
+
+    subscription = broker.subscribe(current_app.config["SQLALCHEMY_DATABASE_URI"], current_app.config["STREAM_MAX_QUEUED"])
+    heartbeat = current_app.config["STREAM_HEARTBEAT_SECONDS"]
+
+    # The generator doesn't use the app context or the database, so idle subscribers don't hold on to a database connection
+    def stream():
+        try:
+
+            # Tell the browser how long to wait before reconnecting if the stream drops
+            yield "retry: 5000\n\n"
+
+            while not subscription.closed:
+                event = subscription.get(heartbeat)
+
+                # Comments keep proxies (the Heroku router closes idle connections after 55 seconds) from timing out the stream
+                yield event if event is not None else ": heartbeat\n\n"
+        finally:
+            broker.unsubscribe(subscription)
+
+    return Response(stream(), mimetype="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+# Error handling routes
+# One for invalid routes, and one for server errors
+@main.app_errorhandler(404)
+def not_found_error(error):
+    response = jsonify({
+        "status": "Failure",
+        "message": "Invalid route"
+    })
+
+    # make_response needs to be used to be able to specify the status code
+    return make_response((response, 404))
+
+
+@main.app_errorhandler(500)
+def internal_error(error):
+
+    # Roll back the database to a valid state
+    db.session.rollback()
+
+    response = jsonify({
+        "status": "Failure",
+        "message": "Server error. Contact an admin if this problem persists"
+    })
+
+    # make_response needs to be used to be able to specify the status code
+    return make_response((response, 500))
@@ -0,0 +1,60 @@
+# Gunicorn settings, used by the Procfile
+import os
+
+workers = int(os.environ.get("WEB_CONCURRENCY", 3))
+
+# Each open /api/stream connection would hold a sync worker, so gevent is used to serve many stream subscribers from each worker
+# Each worker accepts enough connections for STREAM_MAX_SUBSCRIBERS streams on top of the regular requests
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "gevent")
+worker_connections = int(os.environ.get("GUNICORN_WORKER_CONNECTIONS", 2000))
+
+# The app is preloaded in the master, before gunicorn would patch the workers
+# Patching here instead means the locks, threads and queues the app creates when it's imported are gevent's, rather than ones that block the whole worker
+if worker_class == "gevent":
+    from gevent import monkey
+
+    monkey.patch_all()
+
+# The app is created once in the master and shared with the workers copy on write, so each worker doesn't import and set it up again
+preload_app = True
+
+
+def post_fork(server, worker):
+    """ Drops any database connections inherited from the master
+    Connections can't be shared between processes, so each worker opens its own when it first needs one
+    """
+
+    from app.models import db
+
+    app = server.app.wsgi()
+
+    with app.app_context():
+        db.engine.dispose()
+
+
+def post_worker_init(worker):
+    """ Makes psycopg2 yield to other greenlets while it waits on the database
+    Without this every query blocks the whole gevent worker, and all of the requests and streams it's serving
+    This runs after gunicorn has monkey patched the worker, which happens after post_fork
+    """
+
+    from app.events import is_async_worker
+
+    if is_async_worker():
+        from psycogreen.gevent import patch_psycopg
+
+        patch_psycopg()
+
+
+def worker_exit(server, worker):
+    """ Writes the view counts the worker hasn't flushed yet, so they aren't lost when it's restarted """
+
+    from app.counters import view_counter
+
+    app = server.app.wsgi()
+
+    with app.app_context():
+        try:
+            view_counter.flush()
+        except Exception:
+            app.logger.exception("Flushing view counts failed")
@@ -4,10 +4,23 @@ from flask_script import Manager
 from flask_script.commands import ShowUrls, Clean
 from flask_migrate import Migrate, MigrateCommand
 from app import create_app
-from app.models import db, Photo
+from app.models import db, Photo, Upload
+from app.lib import generate_placeholder, process_photo
+from app.encoder import InvalidImage
+from app.storage import image_path, image_fallback, open_image, sharded_path, copy_image, delete_image, delete_pending_upload
+from concurrent.futures import ThreadPoolExecutor
+from app.assets import build_assets as build_static_assets
+from app.profiler import generate_profile_token
+from app.ratelimit import DatabaseBackend, MemoryBackend
+from datetime import timedelta
+import subprocess
+import time
+import sys
+import os
 
 # Default to dev config because no one should use this in production anyway
-app = create_app('app.settings.DevConfig')
+# Maintenance commands like backfill_placeholders can be run against prod with APP_SETTINGS=app.settings.ProdConfig
+app = create_app(os.environ.get("APP_SETTINGS", 'app.settings.DevConfig'))
 migrate = Migrate(app, db)
 
 manager = Manager(app)
@@ -25,5 +38,196 @@ def make_shell_context():
     return dict(app=app, db=db, Photo=Photo)
 
 
+@manager.command
+def build_assets():
+    """ Fingerprints, minifies and precompresses the files in app/static """
+
+    manifest = build_static_assets(app.static_folder)
+
+    for filename, built_filename in sorted(manifest.items()):
+        print("{} -> {}".format(filename, built_filename))
+
+
+@manager.command
+def backfill_placeholders(batch_size=100):
+    """ Stores the size and placeholder of photos uploaded before they were generated """
+
+    from PIL import Image
+
+    batch_size = int(batch_size)
+    done = 0
+
+    while True:
+
+        # Photos that fail are skipped by id so the loop doesn't keep fetching them
+        photos = Photo.query.filter(Photo.placeholder == None, Photo.id > done).order_by(Photo.id).limit(batch_size).all()
+
+        if not photos:
+            break
+
+        for photo in photos:
+            done = photo.id
+
+            try:
+                image_file = open_image(app.config, image_path(photo), fallback=image_fallback(app.config, photo))
+                image = Image.open(image_file)
+
+                photo.width, photo.height = image.size
+                photo.placeholder = generate_placeholder(image)
+
+                image.close()
+                image_file.close()
+            except IOError as e:
+                print("Skipping photo {}: {}".format(photo.id, e))
+
+        # Commit once per batch to avoid a round trip for every photo
+        db.session.commit()
+
+        print("Backfilled up to photo {}".format(done))
+
+
+@manager.command
+def migrate_storage(workers=8, batch_size=100):
+    """ Moves images stored flat at their filename to their sharded storage path
+    The site stays up during the move. Each image is copied first, then its new path is committed, and only then is the old one deleted
+    Until the copy is committed reads use the old path, and fall back to the new one in case it was deleted after the photo was loaded
+    """
+
+    workers = int(workers)
+    batch_size = int(batch_size)
+    config = app.config
+    failed = set()
+
+    def copy(move):
+        photo_id, source, destination = move
+
+        try:
+            copy_image(config, source, destination)
+            return photo_id
+        except (IOError, OSError) as e:
+            print("Skipping photo {}: {}".format(photo_id, e))
+            return None
+
+    def delete(path):
+        try:
+            delete_image(config, path)
+        except (IOError, OSError) as e:
+
+            # The image has already been moved, so a leftover old copy only wastes space
+            print("Couldn't delete {}: {}".format(path, e))
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while True:
+
+            # Photos that failed are left out so the loop doesn't keep fetching them
+            query = Photo.query.filter(Photo.storage_path == None)
+
+            if failed:
+                query = query.filter(~Photo.id.in_(failed))
+
+            photos = query.order_by(Photo.id).limit(batch_size).all()
+
+            if not photos:
+                break
+
+            moves = {photo.id: (photo.id, photo.filename, sharded_path(photo.filename, config["STORAGE_FANOUT"])) for photo in photos}
+
+            # The copies are done in parallel, as each one is mostly waiting on S3 or the disk
+            copied = set(photo_id for photo_id in executor.map(copy, moves.values()) if photo_id is not None)
+
+            for photo in photos:
+                if photo.id in copied:
+                    photo.storage_path = moves[photo.id][2]
+                else:
+                    failed.add(photo.id)
+
+            db.session.commit()
+
+            # The old copies are only deleted once nothing points at them anymore
+            list(executor.map(delete, [moves[photo_id][1] for photo_id in copied]))
+
+            print("Moved {} images, up to photo {}".format(len(copied), photos[-1].id))
+
+
+@manager.command
+def process_photos():
+    """ Re-encodes direct uploads that weren't processed, like ones whose worker restarted before getting to them """
+
+    for photo in Photo.query.filter_by(processed=False).order_by(Photo.id).all():
+        try:
+            process_photo(photo.id, app.config)
+            print("Processed photo {}".format(photo.id))
+        except InvalidImage as e:
+            print("Removed photo {}, which isn't a valid image: {}".format(photo.id, e))
+        except IOError as e:
+            db.session.rollback()
+            print("Skipping photo {}: {}".format(photo.id, e))
+
+
+@manager.command
+def clean_uploads(hours=24):
+    """ Deletes resumable uploads that were started more than the specified number of hours ago and never finalized """
+
+    # The cutoff is worked out by the database, as that's the clock created_on comes from
+    for upload in Upload.query.filter(Upload.created_on < db.func.now() - timedelta(hours=int(hours))).all():
+
+        # One upload that can't be deleted shouldn't stop the rest from being cleaned up
+        try:
+            delete_pending_upload(app.config, upload.id, upload.multipart_id)
+        except Exception as e:
+            print("Skipping upload {}: {}".format(upload.id, e))
+            continue
+
+        db.session.delete(upload)
+
+        print("Deleted upload {}".format(upload.id))
+
+    db.session.commit()
+
+
+@manager.command
+def profile_token():
+    """ Prints a value for the X-Profile header, which makes the request it's sent with get profiled """
+
+    print(generate_profile_token(app.config["ADMIN_PASSWORD"]))
+
+
+@manager.command
+def benchmark_startup(runs=10):
+    """ Measures how long a new process takes to import and create the app, which is what each worker pays when it boots """
+
+    runs = int(runs)
+    script = "import time; start = time.perf_counter(); from app import create_app; create_app('app.settings.ProdConfig'); print(time.perf_counter() - start)"
+
+    # Each run is a new interpreter so nothing is already imported
+    times = sorted(float(subprocess.check_output([sys.executable, "-c", script])) for i in range(runs))
+
+    print("Startup over {} runs: min {:.1f} ms, median {:.1f} ms, max {:.1f} ms".format(runs, times[0] * 1000, times[runs // 2] * 1000, times[-1] * 1000))
+
+
+@manager.command
+def benchmark_ratelimit(iterations=10000):
+    """ Measures the overhead the rate limiter adds to each limited request """
+
+    iterations = int(iterations)
+
+    for backend in [MemoryBackend(), DatabaseBackend(max_seconds=60)]:
+        with app.test_request_context():
+
+            # Use a rate high enough that every hit is allowed, as allowed requests are the common case
+            start = time.perf_counter()
+
+            for i in range(iterations):
+                backend.hit("benchmark:127.0.0.1", iterations, float(iterations))
+
+            elapsed = time.perf_counter() - start
+
+            print("{}: {:.1f} microseconds per request".format(backend.__class__.__name__, elapsed / iterations * 1000000))
+
+            if isinstance(backend, DatabaseBackend):
+                db.session.execute("DELETE FROM rate_limit_bucket WHERE key = 'benchmark:127.0.0.1'")
+                db.session.commit()
+
+
 if __name__ == "__main__":
     manager.run()
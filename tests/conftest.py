@@ -1,4 +1,5 @@
 import pytest
+import shutil
 import os
 
 from app import create_app
@@ -23,8 +24,13 @@ def testapp(request):
         db.drop_all()
 
         for f in os.listdir(os.path.join(os.path.abspath(os.path.dirname(__file__)), "images")):
-            if f != "test.jpg":
-                os.remove(os.path.join(os.path.abspath(os.path.dirname(__file__)), "images", f))
+            path = os.path.join(os.path.abspath(os.path.dirname(__file__)), "images", f)
+
+            # Uploaded images are stored in sharded directories
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            elif f != "test.jpg":
+                os.remove(path)
 
 
     request.addfinalizer(teardown)
@@ -4,6 +4,7 @@ import pytest
 import os
 from flask import json
 from app.models import db, Photo
+from app import lib
 
 create_photo = True
 
@@ -66,6 +67,22 @@ class TestURLs:
 
         assert photo
 
+    def test_image_upload_placeholder(self, testapp):
+        """ Tests whether uploaded images get their size and placeholder stored """
+
+        basedir = os.path.abspath(os.path.dirname(__file__))
+
+        with open(os.path.join(basedir, "test.jpg"), "rb") as image:
+            testapp.post("/api/images", data=dict(title="HLH", file=image))
+
+        rv = testapp.get("/api/images?sort=new")
+
+        return_data = json.loads(rv.get_data())
+
+        assert return_data["data"][0]["width"]
+        assert return_data["data"][0]["height"]
+        assert return_data["data"][0]["placeholder"].startswith("data:image/jpeg;base64,")
+
     def test_missing_file_error(self, testapp):
         """ Tests if not including a file errors out """
 
@@ -225,3 +242,40 @@ class TestURLs:
 
         assert rv.status_code == 400
         assert return_data["status"] == "Failure"
+
+    def test_has_more(self, testapp):
+        """ Test has_more is only set when there's another page """
+
+        rv = testapp.get("/api/images")
+
+        assert json.loads(rv.get_data())["has_more"] is False
+
+        for i in range(10):
+            db.session.add(Photo(title="Title", filename=str(i) + "test.jpg", mimetype="image/jpg"))
+
+        db.session.commit()
+
+        rv = testapp.get("/api/images?page=1")
+
+        assert json.loads(rv.get_data())["has_more"] is True
+
+        rv = testapp.get("/api/images?page=2")
+
+        assert json.loads(rv.get_data())["has_more"] is False
+
+    def test_total(self, testapp):
+        """ Test the total is only returned when it's asked for """
+
+        # Clear the count cached by earlier tests
+        lib._count_cache = None
+
+        rv = testapp.get("/api/images")
+
+        assert "total" not in json.loads(rv.get_data())
+
+        rv = testapp.get("/api/images?total=true")
+
+        return_data = json.loads(rv.get_data())
+
+        assert return_data["total"] == 1
+        assert return_data["total_approximate"] is False
@@ -0,0 +1,28 @@
+#! ../venv/bin/python
+
+import pytest
+import subprocess
+import sys
+
+create_photo = False
+
+
+@pytest.mark.usefixtures("testapp")
+class TestApp:
+
+    def test_lazy_imports(self, testapp):
+        """ Test creating the app doesn't import boto or Pillow """
+
+        script = "import sys; from app import create_app; create_app('app.settings.TestConfig'); print('boto' in sys.modules or 'PIL' in sys.modules)"
+
+        assert subprocess.check_output([sys.executable, "-c", script]).strip() == b"False"
+
+    def test_routes_registered_once(self, testapp):
+        """ Test routes come from the blueprint, so every app has the same ones """
+
+        from app import create_app
+
+        first = sorted(str(rule) for rule in create_app("app.settings.TestConfig").url_map.iter_rules())
+        second = sorted(str(rule) for rule in create_app("app.settings.TestConfig").url_map.iter_rules())
+
+        assert first == second
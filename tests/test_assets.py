@@ -0,0 +1,87 @@
+#! ../venv/bin/python
+
+import pytest
+import json
+import gzip
+import os
+from flask import url_for
+
+from app import create_app
+from app.assets import Assets, build_assets, minify_css, IMMUTABLE_CACHE_CONTROL
+from app.compression import brotli
+
+create_photo = False
+
+
+@pytest.mark.usefixtures("testapp")
+class TestAssets:
+
+    def test_minify_css(self, testapp):
+        """ Test comments and extra whitespace are removed from stylesheets """
+
+        css = "/* Comment */\na :hover {\n    color: #fff;\n    margin: 0 auto;\n}\n"
+
+        assert minify_css(css) == "a :hover{color:#fff;margin:0 auto}"
+
+    def test_build_assets(self, testapp, tmpdir):
+        """ Test built files are fingerprinted, precompressed and listed in the manifest """
+
+        tmpdir.mkdir("css").join("style.css").write("body {\n    color: red;\n}\n")
+
+        manifest = build_assets(str(tmpdir))
+
+        built_filename = manifest["css/style.css"]
+
+        assert built_filename != "css/style.css"
+        assert os.path.isfile(os.path.join(str(tmpdir), built_filename))
+        assert os.path.isfile(os.path.join(str(tmpdir), built_filename + ".gz"))
+
+        with open(os.path.join(str(tmpdir), "build", "manifest.json")) as f:
+            assert json.load(f) == manifest
+
+    def test_rebuild_skips_output(self, testapp, tmpdir):
+        """ Test building twice doesn't fingerprint the previous output """
+
+        tmpdir.join("style.css").write("body { color: red; }")
+
+        build_assets(str(tmpdir))
+        manifest = build_assets(str(tmpdir))
+
+        assert list(manifest.keys()) == ["style.css"]
+
+    def test_serve_built_assets(self, testapp, tmpdir):
+        """ Test urls point at the built files, which are sent precompressed with immutable cache headers """
+
+        tmpdir.mkdir("css").join("style.css").write("body {\n    color: red;\n}\n")
+
+        manifest = build_assets(str(tmpdir))
+
+        app = create_app("app.settings.TestConfig")
+        app.static_folder = str(tmpdir)
+        Assets(app)
+
+        with app.test_request_context():
+            url = url_for("static", filename="css/style.css")
+
+        assert url == "/static/" + manifest["css/style.css"]
+
+        client = app.test_client()
+
+        rv = client.get(url, headers={"Accept-Encoding": "gzip"})
+
+        assert rv.status_code == 200
+        assert rv.headers["Content-Encoding"] == "gzip"
+        assert rv.headers["Cache-Control"] == IMMUTABLE_CACHE_CONTROL
+        assert rv.mimetype == "text/css"
+        assert gzip.decompress(rv.get_data()) == b"body{color:red}"
+
+        # Clients that don't accept compression get the plain file
+        rv = client.get(url, headers={"Accept-Encoding": "identity"})
+
+        assert "Content-Encoding" not in rv.headers
+        assert rv.get_data() == b"body{color:red}"
+
+        if brotli is not None:
+            rv = client.get(url, headers={"Accept-Encoding": "gzip, br"})
+
+            assert rv.headers["Content-Encoding"] == "br"
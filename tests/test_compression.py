@@ -0,0 +1,48 @@
+#! ../venv/bin/python
+
+import pytest
+import gzip
+from app.compression import choose_encoding
+
+create_photo = True
+
+
+@pytest.mark.usefixtures("testapp")
+class TestCompression:
+
+    def test_choose_gzip(self, testapp):
+        """ Test gzip is chosen when it's accepted """
+
+        assert choose_encoding("gzip, deflate") == "gzip"
+        assert choose_encoding("deflate, gzip;q=0.5") == "gzip"
+
+    def test_choose_none(self, testapp):
+        """ Test nothing is chosen when the client doesn't accept any supported encoding """
+
+        assert choose_encoding("") is None
+        assert choose_encoding("identity") is None
+        assert choose_encoding("gzip;q=0") is None
+
+    def test_html_compressed(self, testapp):
+        """ Test rendered pages are gzipped """
+
+        rv = testapp.get("/images", headers={"Accept-Encoding": "gzip"})
+
+        assert rv.status_code == 200
+        assert rv.headers["Content-Encoding"] == "gzip"
+        assert b"</html>" in gzip.decompress(rv.get_data())
+
+    def test_uncompressed_without_header(self, testapp):
+        """ Test responses aren't compressed for clients that don't ask for it """
+
+        rv = testapp.get("/images")
+
+        assert "Content-Encoding" not in rv.headers
+        assert b"</html>" in rv.get_data()
+
+    def test_image_not_compressed(self, testapp):
+        """ Test images are sent without being compressed again """
+
+        rv = testapp.get("/api/images/1", headers={"Accept-Encoding": "gzip"})
+
+        assert "Content-Encoding" not in rv.headers
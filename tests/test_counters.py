@@ -0,0 +1,79 @@
+#! ../venv/bin/python
+
+import pytest
+from flask import json
+from app.counters import HyperLogLog, ViewCounter
+from app.models import Photo
+
+create_photo = True
+
+
+@pytest.mark.usefixtures("testapp")
+class TestCounters:
+
+    def test_sketch_count(self, testapp):
+        """ Test sketches estimate the number of distinct values within a few percent """
+
+        sketch = HyperLogLog(10)
+
+        for i in range(5000):
+            sketch.add("viewer{}".format(i))
+            sketch.add("viewer{}".format(i))
+
+        assert abs(sketch.count() - 5000) < 500
+
+    def test_sketch_merge(self, testapp):
+        """ Test merged sketches count the values added to either """
+
+        first = HyperLogLog(10)
+        second = HyperLogLog(10)
+
+        for i in range(100):
+            first.add(str(i))
+            second.add(str(i + 50))
+
+        first.merge(HyperLogLog(10, second.to_bytes()))
+
+        assert abs(first.count() - 150) < 15
+
+    def test_flush_batches_views(self, testapp):
+        """ Test views are only written when the counter is flushed """
+
+        counter = ViewCounter()
+
+        with testapp.application.app_context():
+            counter.record(1, "first")
+            counter.record(1, "first")
+            counter.record(1, "second")
+
+            assert Photo.query.filter_by(id=1).first().views == 0
+            assert counter.flush() == 1
+
+            photo = Photo.query.filter_by(id=1).first()
+
+            assert photo.views == 3
+            assert photo.unique_viewers == 2
+
+            # Nothing is written when there are no new views
+            assert counter.flush() == 0
+
+    def test_image_views(self, testapp):
+        """ Test fetching an image counts a view, which is returned with the image list """
+
+        testapp.get("/api/images/1")
+        testapp.get("/api/images/1")
+
+        data = json.loads(testapp.get("/api/images").get_data())
+
+        assert data["data"][0]["views"] == 2
+        assert data["data"][0]["unique_viewers"] == 1
+
+    def test_hot_sort_views(self, testapp):
+        """ Test the hot sort works with views weighted in """
+
+        testapp.application.config["HOT_VIEWS_WEIGHT"] = 1.0
+
+        rv = testapp.get("/api/images?sort=hot")
+
+        assert rv.status_code == 200
+        assert "unique_viewers" in json.loads(rv.get_data())["data"][0]
@@ -0,0 +1,173 @@
+#! ../venv/bin/python
+
+import pytest
+import os
+from io import BytesIO
+from PIL import Image
+from flask import json
+from moto import mock_s3_deprecated
+
+from app import create_app, storage
+from app.models import Photo
+from app.settings import TestConfig
+
+create_photo = False
+
+basedir = os.path.abspath(os.path.dirname(__file__))
+
+
+class S3Config(TestConfig):
+    """ Prod storage, against the S3 stand-in from moto """
+
+    ENV = "prod"
+    S3_KEY = "key"
+    S3_SECRET = "secret"
+    S3_BUCKET = "shamrok-test"
+    S3_UPLOAD_DIRECTORY = "images"
+    S3_PENDING_DIRECTORY = "pending"
+
+
+@pytest.fixture()
+def s3(request):
+    mock = mock_s3_deprecated()
+    mock.start()
+
+    # Connections made before the mock started would go to the real S3
+    storage._connections.pid = None
+
+    import boto
+    bucket = boto.connect_s3(S3Config.S3_KEY, S3Config.S3_SECRET).create_bucket(S3Config.S3_BUCKET)
+
+    request.addfinalizer(mock.stop)
+
+    return bucket
+
+
+@pytest.mark.usefixtures("testapp")
+class TestDirectUploads:
+
+    def test_needs_s3(self, testapp):
+        """ Test direct uploads aren't available without S3 """
+
+        rv = testapp.post("/api/uploads/direct", data=dict(title="Title", filename="test.jpg"))
+
+        assert rv.status_code == 400
+
+    def test_presign(self, testapp, s3):
+        """ Test the signed form is scoped to a generated key """
+
+        client = create_app(S3Config).test_client()
+
+        rv = client.post("/api/uploads/direct", data=dict(title="Title", filename="test.jpg"))
+
+        return_data = json.loads(rv.get_data())
+
+        assert rv.status_code == 200
+        assert return_data["fields"]["key"].startswith(S3Config.S3_UPLOAD_DIRECTORY + "/")
+        assert return_data["fields"]["key"].endswith(".jpg")
+        assert "policy" in return_data["fields"]
+        assert return_data["token"]
+
+    def test_finalize(self, testapp, s3):
+        """ Test finalizing creates the photo and re-encodes it """
+
+        client = create_app(S3Config).test_client()
+
+        rv = client.post("/api/uploads/direct", data=dict(title="Direct", filename="test.jpg"))
+        return_data = json.loads(rv.get_data())
+
+        # Stands in for the browser posting the form to S3
+        with open(os.path.join(basedir, "test.jpg"), "rb") as f:
+            s3.new_key(return_data["fields"]["key"]).set_contents_from_file(f, headers={"Content-Type": "image/jpeg"})
+
+        rv = client.post("/api/uploads/direct/finalize", data=dict(token=return_data["token"]))
+
+        assert rv.status_code == 200
+
+        photo = Photo.query.filter_by(title="Direct").first()
+
+        assert photo.processed
+        assert photo.placeholder
+
+        # Finalizing twice doesn't make a second photo
+        rv = client.post("/api/uploads/direct/finalize", data=dict(token=return_data["token"]))
+
+        assert rv.status_code == 409
+
+    def test_finalize_renamed(self, testapp, s3):
+        """ Test finalizing twice is caught after processing has converted the photo and changed its filename """
+
+        client = create_app(S3Config).test_client()
+
+        rv = client.post("/api/uploads/direct", data=dict(title="Direct", filename="test.bmp"))
+        return_data = json.loads(rv.get_data())
+
+        bmp = BytesIO()
+        Image.open(os.path.join(basedir, "test.jpg")).save(bmp, format="bmp")
+        bmp.seek(0)
+
+        s3.new_key(return_data["fields"]["key"]).set_contents_from_file(bmp, headers={"Content-Type": "image/bmp"})
+
+        rv = client.post("/api/uploads/direct/finalize", data=dict(token=return_data["token"]))
+
+        assert rv.status_code == 200
+        assert Photo.query.filter_by(title="Direct").first().filename.endswith(".jpg")
+
+        rv = client.post("/api/uploads/direct/finalize", data=dict(token=return_data["token"]))
+
+        assert rv.status_code == 409
+        assert Photo.query.filter_by(title="Direct").count() == 1
+
+    def test_finalize_not_image(self, testapp, s3):
+        """ Test finalizing an upload that isn't an image is rejected, even with an image content type """
+
+        client = create_app(S3Config).test_client()
+
+        rv = client.post("/api/uploads/direct", data=dict(title="Direct", filename="test.jpg"))
+        return_data = json.loads(rv.get_data())
+
+        s3.new_key(return_data["fields"]["key"]).set_contents_from_string(b"<html></html>", headers={"Content-Type": "image/jpeg"})
+
+        rv = client.post("/api/uploads/direct/finalize", data=dict(token=return_data["token"]))
+
+        assert rv.status_code == 400
+        assert json.loads(rv.get_data())["message"] == "Invalid image"
+        assert not Photo.query.filter_by(title="Direct").first()
+        assert s3.get_key(return_data["fields"]["key"]) is None
+
+    def test_process_broken_image(self, testapp, s3):
+        """ Test a photo whose upload starts like an image but can't be decoded is removed when it's processed """
+
+        client = create_app(S3Config).test_client()
+
+        rv = client.post("/api/uploads/direct", data=dict(title="Direct", filename="test.jpg"))
+        return_data = json.loads(rv.get_data())
+
+        with open(os.path.join(basedir, "test.jpg"), "rb") as f:
+            data = f.read()
+
+        s3.new_key(return_data["fields"]["key"]).set_contents_from_string(data[:len(data) // 2], headers={"Content-Type": "image/jpeg"})
+
+        rv = client.post("/api/uploads/direct/finalize", data=dict(token=return_data["token"]))
+
+        assert rv.status_code == 200
+        assert not Photo.query.filter_by(title="Direct").first()
+        assert s3.get_key(return_data["fields"]["key"]) is None
+
+    def test_finalize_missing(self, testapp, s3):
+        """ Test finalizing before the image is uploaded errors out """
+
+        client = create_app(S3Config).test_client()
+
+        rv = client.post("/api/uploads/direct", data=dict(title="Direct", filename="test.jpg"))
+
+        rv = client.post("/api/uploads/direct/finalize", data=dict(token=json.loads(rv.get_data())["token"]))
+
+        assert rv.status_code == 400
+
+    def test_finalize_invalid_token(self, testapp):
+        """ Test tokens that weren't signed by the server are rejected """
+
+        rv = testapp.post("/api/uploads/direct/finalize", data=dict(token="invalid"))
+
+        assert rv.status_code == 400
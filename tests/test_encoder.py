@@ -0,0 +1,144 @@
+#! ../venv/bin/python
+
+import pytest
+import os
+from io import BytesIO
+from PIL import Image, ImageCms
+
+from app.encoder import encode_image, apply_orientation, similarity
+
+create_photo = False
+
+basedir = os.path.abspath(os.path.dirname(__file__))
+
+
+@pytest.mark.usefixtures("testapp")
+class TestEncoder:
+
+    def test_jpeg_stats(self, testapp):
+        """ Test jpegs are re-encoded and the savings are reported """
+
+        with open(os.path.join(basedir, "test.jpg"), "rb") as f:
+            encoded = encode_image(f, testapp.application.config)
+
+        assert encoded.extension == "jpg"
+        assert encoded.stats["encoded_bytes"] == len(encoded.data)
+        assert encoded.stats["bytes_saved"] == encoded.stats["original_bytes"] - len(encoded.data)
+        assert testapp.application.config["ENCODER_QUALITY_MIN"] <= encoded.stats["quality"] <= testapp.application.config["ENCODER_QUALITY_MAX"]
+
+    def test_jpeg_source_quality(self, testapp):
+        """ Test jpegs aren't re-encoded below the quality they were uploaded at """
+
+        upload = BytesIO()
+        Image.open(os.path.join(basedir, "test.jpg")).save(upload, format="jpeg", quality=50)
+        upload.seek(0)
+
+        encoded = encode_image(upload, testapp.application.config)
+
+        assert encoded.stats["quality"] >= 50
+
+    def test_jpeg_not_larger(self, testapp):
+        """ Test jpegs that can't be made smaller are kept as they were uploaded """
+
+        upload = BytesIO()
+        Image.open(os.path.join(basedir, "test.jpg")).save(upload, format="jpeg", quality=30, optimize=True)
+        upload.seek(0)
+
+        encoded = encode_image(upload, testapp.application.config)
+
+        assert encoded.stats["bytes_saved"] >= 0
+
+    def test_photo_bmp_converted(self, testapp):
+        """ Test photos uploaded as bmps are converted to jpegs """
+
+        bmp = BytesIO()
+        Image.open(os.path.join(basedir, "test.jpg")).save(bmp, format="bmp")
+        bmp.seek(0)
+
+        encoded = encode_image(bmp, testapp.application.config)
+
+        assert encoded.mimetype == "image/jpeg"
+        assert encoded.stats["bytes_saved"] > 0
+
+    def test_drawing_png_kept(self, testapp):
+        """ Test images with few colours stay lossless pngs """
+
+        png = BytesIO()
+        Image.new("RGB", (200, 100), (255, 255, 255)).save(png, format="png")
+        png.seek(0)
+
+        encoded = encode_image(png, testapp.application.config)
+
+        assert encoded.mimetype == "image/png"
+
+    def test_palette_transparency_kept(self, testapp):
+        """ Test the transparent index of palette pngs is kept """
+
+        image = Image.new("P", (50, 50), 0)
+        image.putpalette([0, 0, 0, 255, 0, 0] + [0] * 762)
+        image.paste(1, (10, 10, 20, 20))
+
+        png = BytesIO()
+        image.save(png, format="png", transparency=0)
+        png.seek(0)
+
+        encoded = encode_image(png, testapp.application.config)
+
+        assert encoded.mimetype == "image/png"
+        assert Image.open(BytesIO(encoded.data)).convert("RGBA").getpixel((0, 0))[3] == 0
+
+    def test_colour_key_transparency_kept(self, testapp):
+        """ Test the transparent colour of RGB pngs is kept """
+
+        image = Image.new("RGB", (50, 50), (255, 255, 255))
+        image.paste((1, 2, 3), (10, 10, 20, 20))
+
+        png = BytesIO()
+        image.save(png, format="png", transparency=(255, 255, 255))
+        png.seek(0)
+
+        encoded = encode_image(png, testapp.application.config)
+
+        assert Image.open(BytesIO(encoded.data)).convert("RGBA").getpixel((0, 0))[3] == 0
+
+    def test_icc_profile_stripped(self, testapp):
+        """ Test jpegs with an ICC profile are re-encoded without it """
+
+        srgb = ImageCms.ImageCmsProfile(ImageCms.createProfile("sRGB")).tobytes()
+
+        jpeg = BytesIO()
+        Image.open(os.path.join(basedir, "test.jpg")).save(jpeg, format="jpeg", quality=30, optimize=True, icc_profile=srgb)
+        jpeg.seek(0)
+
+        encoded = encode_image(jpeg, testapp.application.config)
+
+        assert "icc_profile" not in Image.open(BytesIO(encoded.data)).info
+
+    def test_iptc_stripped(self, testapp):
+        """ Test jpegs with IPTC metadata are re-encoded even when that doesn't make them smaller """
+
+        jpeg = BytesIO()
+        Image.open(os.path.join(basedir, "test.jpg")).save(jpeg, format="jpeg", quality=30, optimize=True)
+
+        # An APP13 segment, which is where IPTC data like the byline and location is kept
+        data = jpeg.getvalue()
+        data = data[:2] + b"\xff\xed\x00\x0aPhoto\x00\x00\x00" + data[2:]
+
+        encoded = encode_image(BytesIO(data), testapp.application.config)
+
+        assert encoded.data != data
+        assert [marker for marker, segment in Image.open(BytesIO(encoded.data)).applist] == ["APP0"]
+
+    def test_similarity(self, testapp):
+        """ Test identical images are completely similar """
+
+        image = Image.open(os.path.join(basedir, "test.jpg")).convert("L").crop((0, 0, 64, 64))
+
+        assert abs(similarity(image, image) - 1.0) < 0.000001
+
+    def test_no_orientation(self, testapp):
+        """ Test images without EXIF orientation are left as they are """
+
+        image = Image.new("RGB", (20, 10))
+
+        assert apply_orientation(image).size == (20, 10)
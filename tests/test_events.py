@@ -0,0 +1,86 @@
+#! ../venv/bin/python
+
+import pytest
+import json
+import os
+from app.events import Broker, format_event
+
+create_photo = True
+
+
+@pytest.mark.usefixtures("testapp")
+class TestEvents:
+
+    def test_format_event(self, testapp):
+        """ Test notification payloads are turned into server sent events """
+
+        event = format_event(json.dumps({"event": "vote", "data": {"id": 1, "votes": 2}}))
+
+        assert event.startswith("event: vote\ndata: ")
+        assert event.endswith("\n\n")
+
+    def test_deliver(self, testapp):
+        """ Test delivered events reach every subscriber """
+
+        broker = Broker()
+
+        # Pretend the listener has already been started in this process so the test doesn't need one
+        broker.listener_pid = os.getpid()
+
+        first = broker.subscribe(None, 10)
+        second = broker.subscribe(None, 10)
+
+        broker.deliver("event")
+
+        assert first.get(0) == "event"
+        assert second.get(0) == "event"
+        assert first.get(0) is None
+
+    def test_invalid_notification_skipped(self, testapp):
+        """ Test notifications that aren't events are skipped without stopping later ones """
+
+        broker = Broker()
+        broker.listener_pid = os.getpid()
+
+        subscription = broker.subscribe(None, 10)
+
+        broker.notify("not json")
+        broker.notify(json.dumps({"data": {}}))
+        broker.notify(json.dumps({"event": "vote", "data": {"id": 1, "votes": 2}}))
+
+        assert subscription.get(0).startswith("event: vote")
+        assert subscription.get(0) is None
+
+    def test_slow_subscriber_dropped(self, testapp):
+        """ Test subscribers that fall too far behind are dropped """
+
+        broker = Broker()
+        broker.listener_pid = os.getpid()
+
+        subscription = broker.subscribe(None, 1)
+
+        broker.deliver("first")
+        broker.deliver("second")
+
+        assert subscription.closed
+        assert broker.count() == 0
+
+    def test_stream(self, testapp):
+        """ Test the stream route returns an event stream """
+
+        rv = testapp.get("/api/stream", buffered=False)
+
+        assert rv.status_code == 200
+        assert rv.mimetype == "text/event-stream"
+        assert next(iter(rv.response)).startswith(b"retry:")
+
+        rv.close()
+
+    def test_stream_requires_async(self, testapp):
+        """ Test streams are refused on sync workers when they're required to be async """
+
+        testapp.application.config["STREAM_REQUIRE_ASYNC"] = True
+
+        rv = testapp.get("/api/stream")
+
+        assert rv.status_code == 503
@@ -1,8 +1,10 @@
 #! ../venv/bin/python
 
 import pytest
+import os
+from PIL import Image
 
-from app.lib import generate_filename
+from app.lib import generate_filename, generate_placeholder
 
 create_photo = False
 
@@ -14,3 +16,14 @@ class TestLibs:
         """ Test random name generator is correct length """
 
         assert len(generate_filename(5)) == 5
+
+    def test_placeholder(self, testapp):
+        """ Test placeholders are tiny jpeg data uris """
+
+        basedir = os.path.abspath(os.path.dirname(__file__))
+
+        image = Image.open(os.path.join(basedir, "test.jpg"))
+        placeholder = generate_placeholder(image)
+
+        assert placeholder.startswith("data:image/jpeg;base64,")
+        assert len(placeholder) < 2000
@@ -0,0 +1,72 @@
+#! ../venv/bin/python
+
+import pytest
+import shutil
+import signal
+import time
+import os
+from threading import get_ident
+from gevent import getcurrent
+
+from app import create_app
+from app.settings import TestConfig
+from app.profiler import Sampler, GreenletSampler, generate_profile_token
+
+create_photo = True
+
+basedir = os.path.abspath(os.path.dirname(__file__))
+
+
+class ProfiledConfig(TestConfig):
+    PROFILER_ENABLED = True
+    PROFILER_OUTPUT_DIR = os.path.join(basedir, "profiles")
+
+
+@pytest.mark.usefixtures("testapp")
+class TestProfiler:
+
+    def test_sampler(self, testapp):
+        """ Test the sampler records the stack of the sampled thread """
+
+        sampler = Sampler(get_ident(), 0.001)
+        sampler.start()
+
+        end = time.time() + 0.1
+        while time.time() < end:
+            pass
+
+        sampler.stop()
+
+        assert any(stack.endswith("test_sampler") for stack in sampler.stacks)
+
+    def test_greenlet_sampler(self, testapp):
+        """ Test the greenlet sampler records the stack of the sampled greenlet, and stops its timer when it's done """
+
+        sampler = GreenletSampler(getcurrent(), 0.001)
+        sampler.start()
+
+        end = time.time() + 0.1
+        while time.time() < end:
+            pass
+
+        sampler.stop()
+
+        assert any(stack.endswith("test_greenlet_sampler") for stack in sampler.stacks)
+        assert signal.getitimer(signal.ITIMER_PROF) == (0.0, 0.0)
+
+    def test_signed_header(self, testapp):
+        """ Test requests with a signed header are profiled, and others aren't """
+
+        client = create_app(ProfiledConfig).test_client()
+
+        try:
+            client.get("/api/images")
+            assert not os.path.isdir(ProfiledConfig.PROFILER_OUTPUT_DIR)
+
+            client.get("/api/images", headers={"X-Profile": "invalid"})
+            assert not os.path.isdir(ProfiledConfig.PROFILER_OUTPUT_DIR)
+
+            client.get("/api/images", headers={"X-Profile": generate_profile_token(ProfiledConfig.ADMIN_PASSWORD)})
+            assert len(os.listdir(ProfiledConfig.PROFILER_OUTPUT_DIR)) == 1
+        finally:
+            shutil.rmtree(ProfiledConfig.PROFILER_OUTPUT_DIR, ignore_errors=True)
@@ -0,0 +1,109 @@
+#! ../venv/bin/python
+
+import pytest
+from flask import json
+from app.ratelimit import MemoryBackend, DatabaseBackend
+from app.models import db, RateLimitBucket
+import time
+
+create_photo = True
+
+
+@pytest.mark.usefixtures("testapp")
+class TestRateLimit:
+
+    def test_memory_backend_limit(self, testapp):
+        """ Test the memory backend only allows as many requests as the bucket capacity """
+
+        backend = MemoryBackend()
+
+        for i in range(3):
+            assert backend.hit("test", 3, 0.001) == 0
+
+        assert backend.hit("test", 3, 0.001) > 0
+
+    def test_memory_backend_keys(self, testapp):
+        """ Test buckets with different keys don't share tokens """
+
+        backend = MemoryBackend()
+
+        assert backend.hit("first", 1, 0.001) == 0
+        assert backend.hit("second", 1, 0.001) == 0
+        assert backend.hit("first", 1, 0.001) > 0
+
+    def test_memory_backend_prune(self, testapp):
+        """ Test buckets that have refilled are dropped, and ones that haven't are kept """
+
+        backend = MemoryBackend(prune_seconds=0)
+
+        backend.hit("refilled", 1, 1000.0)
+        backend.hit("empty", 1, 0.001)
+
+        time.sleep(0.01)
+        backend.hit("new", 1, 0.001)
+
+        assert "refilled" not in backend.buckets
+        assert "empty" in backend.buckets
+        assert backend.hit("empty", 1, 0.001) > 0
+
+    def test_database_backend_limit(self, testapp):
+        """ Test the database backend only allows as many requests as the bucket capacity """
+
+        backend = DatabaseBackend(60)
+
+        for i in range(3):
+            assert backend.hit("test", 3, 0.001) == 0
+
+        assert backend.hit("test", 3, 0.001) > 0
+        assert RateLimitBucket.query.filter_by(key="test").first().tokens < 1
+
+    def test_database_backend_refill(self, testapp):
+        """ Test database buckets refill for the time since they were last updated """
+
+        backend = DatabaseBackend(60)
+
+        assert backend.hit("test", 1, 1.0) == 0
+        assert backend.hit("test", 1, 1.0) > 0
+
+        # Pretend the bucket was last touched long enough ago to have refilled
+        db.session.execute("UPDATE rate_limit_bucket SET updated_on = now() - INTERVAL '2 seconds' WHERE key = 'test'")
+        db.session.commit()
+
+        assert backend.hit("test", 1, 1.0) == 0
+
+    def test_database_backend_prune(self, testapp):
+        """ Test rows that haven't been touched for the longest limit period are deleted """
+
+        backend = DatabaseBackend(1, prune_seconds=0)
+
+        backend.hit("stale", 1, 0.001)
+
+        db.session.execute("UPDATE rate_limit_bucket SET updated_on = now() - INTERVAL '10 seconds' WHERE key = 'stale'")
+        db.session.commit()
+
+        backend.hit("fresh", 1, 0.001)
+
+        assert RateLimitBucket.query.filter_by(key="stale").first() is None
+        assert RateLimitBucket.query.filter_by(key="fresh").first()
+
+    def test_upvote_rate_limited(self, testapp):
+        """ Test upvoting too often returns a 429 """
+
+        for i in range(30):
+            rv = testapp.post("/api/images/upvote/1")
+            assert rv.status_code == 200
+
+        rv = testapp.post("/api/images/upvote/1")
+
+        return_data = json.loads(rv.get_data())
+
+        assert rv.status_code == 429
+        assert return_data["status"] == "Failure"
+        assert "Retry-After" in rv.headers
+
+    def test_get_images_not_rate_limited(self, testapp):
+        """ Test only uploads are limited on the images route """
+
+        for i in range(11):
+            rv = testapp.get("/api/images")
+            assert rv.status_code == 200
@@ -0,0 +1,80 @@
+#! ../venv/bin/python
+
+import pytest
+import os
+
+from app.models import db, Photo
+from app.storage import sharded_path, image_path, image_fallback, open_image, copy_image, delete_image, find_local_image, local_path
+
+create_photo = False
+
+
+@pytest.mark.usefixtures("testapp")
+class TestStorage:
+
+    def test_sharded_path(self, testapp):
+        """ Test sharded paths are nested by the configured fan out """
+
+        path = sharded_path("abcdefg.jpg", (2, 2))
+        parts = path.split("/")
+
+        assert len(parts) == 3
+        assert [len(part) for part in parts[:2]] == [2, 2]
+        assert parts[2] == "abcdefg.jpg"
+        assert sharded_path("abcdefg.jpg", (2, 2)) == path
+
+    def test_image_path(self, testapp):
+        """ Test photos without a storage path are stored flat """
+
+        assert image_path(Photo(title="Title", filename="test.jpg", mimetype="image/jpg")) == "test.jpg"
+        assert image_path(Photo(title="Title", filename="test.jpg", mimetype="image/jpg", storage_path="ab/cd/test.jpg")) == "ab/cd/test.jpg"
+
+    def test_fallback(self, testapp):
+        """ Test reads fall back to the other path when the image isn't at the first """
+
+        config = testapp.application.config
+
+        with open_image(config, sharded_path("test.jpg", (2, 2)), fallback="test.jpg") as f:
+            assert f.read()
+
+    def test_image_fallback(self, testapp):
+        """ Test photos that haven't been moved fall back to their sharded path, and moved ones have no fallback """
+
+        config = testapp.application.config
+
+        assert image_fallback(config, Photo(title="Title", filename="test.jpg", mimetype="image/jpg")) == sharded_path("test.jpg", config["STORAGE_FANOUT"])
+        assert image_fallback(config, Photo(title="Title", filename="test.jpg", mimetype="image/jpg", storage_path="ab/cd/test.jpg")) is None
+
+    def test_fallback_after_move(self, testapp):
+        """ Test an image moved after its photo was loaded is still served """
+
+        config = testapp.application.config
+        destination = sharded_path("test.jpg", config["STORAGE_FANOUT"])
+
+        photo = Photo(title="Title", filename="test.jpg", mimetype="image/jpg")
+        db.session.add(photo)
+        db.session.commit()
+
+        copy_image(config, "test.jpg", destination)
+        os.rename(local_path(config, "test.jpg"), local_path(config, "test.jpg") + ".moved")
+
+        try:
+            rv = testapp.get("/api/images/{}".format(photo.id))
+
+            assert rv.status_code == 200
+        finally:
+            os.rename(local_path(config, "test.jpg") + ".moved", local_path(config, "test.jpg"))
+
+    def test_move(self, testapp):
+        """ Test copying an image to its sharded path and deleting the original """
+
+        config = testapp.application.config
+        destination = sharded_path("moved.jpg", (2, 2))
+
+        copy_image(config, "test.jpg", destination)
+
+        assert os.path.isfile(find_local_image(config, destination))
+
+        delete_image(config, destination)
+
+        assert not os.path.isfile(find_local_image(config, destination))
@@ -0,0 +1,136 @@
+#! ../venv/bin/python
+
+import pytest
+import os
+from io import BytesIO
+from flask import json
+from app.models import db, Photo, Upload
+from app.lib import parse_content_range
+
+create_photo = False
+
+basedir = os.path.abspath(os.path.dirname(__file__))
+
+
+def create_upload(testapp, data):
+    rv = testapp.post("/api/uploads", data=dict(title="Resumed", filename="test.jpg", length=len(data)))
+
+    return json.loads(rv.get_data())["id"]
+
+
+def put_chunk(testapp, upload_id, data, start, end):
+    return testapp.put("/api/uploads/" + upload_id, data=data[start:end + 1], headers={"Content-Range": "bytes {}-{}/{}".format(start, end, len(data))})
+
+
+@pytest.mark.usefixtures("testapp")
+class TestUploads:
+
+    def test_parse_content_range(self, testapp):
+        """ Test Content-Range headers are parsed, and invalid ones are rejected """
+
+        assert parse_content_range("bytes 0-1023/4096") == (0, 1023, 4096)
+        assert parse_content_range("bytes 10-5/4096") is None
+        assert parse_content_range("bytes 0-4096/4096") is None
+        assert parse_content_range(None) is None
+
+    def test_create_upload(self, testapp):
+        """ Test creating an upload """
+
+        rv = testapp.post("/api/uploads", data=dict(title="Title", filename="test.jpg", length=100))
+
+        return_data = json.loads(rv.get_data())
+
+        assert rv.status_code == 201
+        assert return_data["offset"] == 0
+        assert Upload.query.filter_by(id=return_data["id"]).first()
+
+    def test_invalid_length(self, testapp):
+        """ Test uploads over the maximum size are rejected """
+
+        rv = testapp.post("/api/uploads", data=dict(title="Title", filename="test.jpg", length=testapp.application.config["UPLOAD_MAX_SIZE"] + 1))
+
+        assert rv.status_code == 400
+
+    def test_chunked_upload(self, testapp):
+        """ Test uploading an image in chunks and finalizing it """
+
+        with open(os.path.join(basedir, "test.jpg"), "rb") as f:
+            data = f.read()
+
+        upload_id = create_upload(testapp, data)
+        middle = len(data) // 2
+
+        assert put_chunk(testapp, upload_id, data, 0, middle - 1).status_code == 200
+
+        # Asking for the offset tells the client where to continue from
+        rv = testapp.get("/api/uploads/" + upload_id)
+
+        assert json.loads(rv.get_data())["offset"] == middle
+        assert rv.headers["Upload-Offset"] == str(middle)
+
+        assert put_chunk(testapp, upload_id, data, middle, len(data) - 1).status_code == 200
+
+        rv = testapp.post("/api/uploads/" + upload_id + "/finalize")
+
+        assert rv.status_code == 200
+        assert Photo.query.filter_by(title="Resumed").first()
+        assert not Upload.query.filter_by(id=upload_id).first()
+
+    def test_finalize_invalid_image(self, testapp):
+        """ Test finalizing an upload that isn't an image is rejected, and the upload is removed """
+
+        data = b"This is not an image" * 100
+
+        upload_id = create_upload(testapp, data)
+
+        assert put_chunk(testapp, upload_id, data, 0, len(data) - 1).status_code == 200
+
+        rv = testapp.post("/api/uploads/" + upload_id + "/finalize")
+
+        assert rv.status_code == 400
+        assert json.loads(rv.get_data())["message"] == "Invalid image"
+        assert not Upload.query.filter_by(id=upload_id).first()
+        assert not os.path.isfile(os.path.join(testapp.application.config["UPLOAD_TEMP_FOLDER"], upload_id))
+
+    def test_wrong_offset(self, testapp):
+        """ Test chunks that don't start at the current offset are rejected """
+
+        data = b"0123456789"
+        upload_id = create_upload(testapp, data)
+
+        rv = put_chunk(testapp, upload_id, data, 5, 9)
+
+        assert rv.status_code == 409
+        assert json.loads(rv.get_data())["offset"] == 0
+
+    def test_offset_moved_while_sending(self, testapp):
+        """ Test a chunk is rejected if another request moved the offset while it was being sent """
+
+        data = b"0123456789"
+        upload_id = create_upload(testapp, data)
+
+        class Stream(BytesIO):
+            def read(self, *args):
+
+                # Another request stores the first half while this chunk is arriving
+                Upload.query.filter_by(id=upload_id).update({"offset": 5})
+                db.session.commit()
+
+                return BytesIO.read(self, *args)
+
+        rv = testapp.put("/api/uploads/" + upload_id, input_stream=Stream(data), content_length=len(data), headers={"Content-Range": "bytes 0-9/10"})
+
+        assert rv.status_code == 409
+        assert json.loads(rv.get_data())["offset"] == 5
+
+    def test_finalize_incomplete(self, testapp):
+        """ Test finalizing before every byte has been sent errors out """
+
+        data = b"0123456789"
+        upload_id = create_upload(testapp, data)
+
+        put_chunk(testapp, upload_id, data, 0, 4)
+
+        rv = testapp.post("/api/uploads/" + upload_id + "/finalize")
+
+        assert rv.status_code == 409